@@ -0,0 +1,63 @@
+import numpy as np
+from parallel import simulate_shard
+
+
+def advance(shards:list, constraints, horizon:int):
+    """
+    Moves the ants of each shard until they are all dead or horizon is reached
+    """
+    for ants in shards:
+        while ants.step<horizon and ants.any_alive():
+            ants.move(constraints)
+    return shards
+
+
+def run_adaptive(constraints, initial_position:tuple, tol:float, width:float, wave_size:int=1000,
+    max_ants:int=10**6, horizon:int=50, step_increment:int=50, max_steps:int=10**4, seed:int=None):
+    """
+    Simulates waves of ants until the standard error of mu (sigma) is below
+    tol and the distance between upper_bound and lower_bound is below width.
+    The standard error shrinks with the number of ants, so a new wave is
+    launched, sized to reach tol according to the current sigma. The bounds
+    only collapse when the ants die, so the horizon of all the waves is
+    extended by step_increment steps. The simulation stops also when
+    max_ants or max_steps are reached.
+    Returns the merged ants and a report of the used resources.
+    """
+    seeds = np.random.SeedSequence(seed)
+    shards = []
+    num_ants = 0
+    size = min(wave_size, max_ants)
+    while True:
+        if size>0:
+            shards.append(simulate_shard(constraints, size, initial_position, seeds.spawn(1)[0], horizon))
+            num_ants += size
+        ants = type(shards[0]).merge(advance(shards, constraints, horizon), constraints)
+        sigma = ants.sigma[ants.step]
+        gap = ants.upper_bound[ants.step] - ants.lower_bound[ants.step]
+        # nan metrics (too few dead ants) are never below the thresholds
+        sigma_ok = bool(sigma<tol)
+        width_ok = bool(gap<width)
+        if sigma_ok and width_ok:
+            break
+        # more steps, also when there are too few dead ants for the metrics
+        extend = (not width_ok or np.isnan(sigma)) and horizon<max_steps and ants.any_alive()
+        if extend:
+            horizon = min(horizon + step_increment, max_steps)
+        # more ants, as many as expected to reach tol (the standard error is proportional to 1/sqrt(n))
+        size = 0
+        if not sigma_ok and np.isfinite(sigma):
+            needed = int(np.ceil(num_ants*(sigma/tol)**2)) - num_ants
+            size = min(max(wave_size, needed), max_ants - num_ants)
+        if not extend and size==0:
+            break
+
+    report = {
+        'converged': sigma_ok and width_ok,
+        'ants': num_ants,
+        'waves': len(shards),
+        'steps': ants.step,
+        'sigma': sigma,
+        'width': gap,
+        }
+    return ants, report
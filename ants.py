@@ -1,6 +1,55 @@
+import json
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+from solver import transition_matrix
+from profiler import profiler
+
+
+# columns of the history, one row per time step
+HISTORY_DTYPE = np.dtype([
+    ('alive', np.int64),
+    ('alive_perc', np.float64),
+    ('dead', np.int64),
+    ('dead_perc', np.float64),
+    ('mu', np.float64),
+    ('sigma', np.float64),
+    ('lower_bound', np.float64),
+    ('upper_bound', np.float64),
+    ('distance', np.float64),
+    ])
+
+
+# history of the simulations with fractional numbers of ants
+FRACTIONAL_HISTORY_DTYPE = np.dtype([(name, np.float64) for name in HISTORY_DTYPE.names])
+# history of the exact distribution, with the standard deviation of the time
+DISTRIBUTION_HISTORY_DTYPE = np.dtype(FRACTIONAL_HISTORY_DTYPE.descr + [('std', np.float64)])
+
+
+def rng_state(rng):
+    """
+    Returns the state of a np.random.Generator or of the np.random module as a JSON string
+    """
+    state = np.random.get_state(legacy=False) if rng is np.random else rng.bit_generator.state
+    return json.dumps(state, default=lambda array: array.tolist())
+
+
+def set_rng_state(rng, text:str):
+    """
+    Restores the state of a np.random.Generator or of the np.random module from rng_state
+    """
+    state = json.loads(text)
+    if state['bit_generator']=='MT19937':
+        state['state']['key'] = np.array(state['state']['key'], dtype=np.uint32)
+    if rng is np.random:
+        np.random.set_state(state)
+    else:
+        rng.bit_generator.state = state
+
+
+def history_column(name:str):
+    """
+    Returns a property with the view of a history column up to the current step
+    """
+    return property(lambda self: self.records[name])
 
 
 class Ants():
@@ -11,34 +60,48 @@ class Ants():
 
     Attributes
     ----------
-    possible_moves : list
-        possible moves to do at each time step
+    rng : np.random.Generator
+        random generator used to draw the moves
     num_initial : int
         initial number of ants
     step : int
         current time step
     initial_position : tuple
         initial ants position
-    positions : pd.DataFrame
-        current position of each ant
-    position_summary : pd.DataFrame
+    origin : np.array
+        coordinates of the initial position
+    positions : np.array
+        current position of each alive ant, stored as int32 lattice offsets
+        from the initial position
+    position_summary : pd.Series
         current number of ants on each occupied position
-    mu : dict
+    records : np.array
+        structured array with the history, one row per time step. The columns
+        are available also as attributes:
+    mu : np.array
         average time (per each time step) that the dead ants needed to reach the food 
-    sigma : dict
+    sigma : np.array
         standard deviation (per each time step) of the time that the dead ants needed to reach the food
-    upper_bound : dict
+    upper_bound : np.array
         upper bound (per each time step) of the predicted average time that the dead ants needed to reach the food 
-    lower_bound : dict
+    lower_bound : np.array
         lower bound (per each time step) of the predicted average time that the dead ants needed to reach the food
-    dead : dict
+    dead : np.array
         number of ants dead per each time step
-    dead_perc : dict
+    dead_perc : np.array
         percentage of ants dead from the beginning per each time step
-    alive : dict
+    alive : np.array
         number of alive ants per each time step
-    alive_perc : dict
+    alive_perc : np.array
         percentage of alive ants per each time step
+    distance : np.array
+        total distance of the alive ants from their closest boundary point per each time step
+    sum_times : int
+        sum of the death times of the dead ants
+    sum_squared_times : int
+        sum of the squared death times of the dead ants
+    estimator : estimators.ControlVariate
+        optional variance reduced estimator of mu, updated at each move
     font_plots : dict
         parameters regarding the font of the plot to display
 
@@ -47,8 +110,19 @@ class Ants():
     -------
     set_initial_positions()
         Initializes the ants position according to the initial_position variable
+    coordinates()
+        Returns the coordinates of the alive ants
+    occupied_positions()
+        Returns the coordinates of the occupied positions and the number of ants on each of them
     move(constraints)
-        Makes a move, checks the alive ants after the move and updates the metrics
+        Makes a move drawn from the kernel of the constraints, checks the alive 
+        ants after the move and updates the metrics
+    any_alive()
+        Returns True while there are alive ants to move
+    update_history(dead:int, distance:float, constraints, alive:float=None)
+        Stores the data of the current step and updates the metrics
+    merge(shards:list, constraints)
+        Joins independent simulations into a single population
     plot_alive_history_plot(max_steps:int=None, ax=None, **plt_kwargs)
         Plots a graph with the historical data regarding the alive ants
     plot_death_history(max_steps:int=None, ax=None, **plt_kwargs)
@@ -56,35 +130,53 @@ class Ants():
     calculate_metrics()
         Calculates, stores and returns the metrics: mu, sigma, upper_bound, lower_bound
     get_info(step:int=None, decimals:int=3)
-        Returns all the useful metadata at a specific time step with a specific precision
-    get_history()
-        Returns the whole historical data regarding the useful metadata
+        Returns all the useful metadata at a specific time step with a specific precision,
+        including the variance reduced estimate of mu (mu_cv) if there is an estimator
+    get_history(start:int=0, stop:int=None)
+        Returns the historical data regarding the useful metadata from the step start
+    to_arrays()
+        Returns the state of the simulation as arrays
+    from_arrays(arrays:dict, constraints)
+        Restores the state of the simulation from arrays
     """
     
     
-    def __init__(self, n:int, initial_position:tuple=(0,0)) -> None:
+    history_dtype = HISTORY_DTYPE
+    mu = history_column('mu')
+    sigma = history_column('sigma')
+    upper_bound = history_column('upper_bound')
+    lower_bound = history_column('lower_bound')
+    dead = history_column('dead')
+    alive = history_column('alive')
+    dead_perc = history_column('dead_perc')
+    alive_perc = history_column('alive_perc')
+    distance = history_column('distance')
+
+
+    def __init__(self, n:int, initial_position:tuple=(0,0), rng=None, max_steps:int=None, estimator=None) -> None:
     
         # consistency checking
         if n<=0:
             raise ValueError("Error: 'n' must be a positive integer")
         assert len(initial_position)==2
         
-        self.possible_moves =  np.array([[1,0], [-1,0], [0,1], [0,-1]])
+        # the global numpy random state is used if no generator is given
+        self.rng = rng if rng is not None else np.random
         # tracking data
         self.num_initial = n
         self.step = 0
         self.initial_position = initial_position
+        self.origin = np.array(initial_position, dtype=float)
         self.positions = self.set_initial_positions()
-        self.position_summary = self.positions.value_counts()
         # metadata
-        self.mu = {0: np.nan}
-        self.sigma = {0: np.nan}
-        self.upper_bound = {0: np.nan}
-        self.lower_bound = {0: np.nan}
-        self.dead = {0: 0}
-        self.alive = {0: n}
-        self.dead_perc = {0: 0.0}
-        self.alive_perc = {0: 1.0}
+        self._history = np.zeros((max_steps or 63) + 1, dtype=self.history_dtype)
+        # the metrics are not defined before the first move
+        first = dict(alive=n, alive_perc=1.0, dead=0, dead_perc=0.0, distance=0.0)
+        self._history[0] = tuple(first.get(name, np.nan) for name in self.history_dtype.names)
+        # running sums of the death times (exact integers)
+        self.sum_times = 0
+        self.sum_squared_times = 0
+        self.estimator = estimator
         # plot parameters
         self.font_plots = {
             'family': 'serif',
@@ -95,39 +187,154 @@ class Ants():
 
     def set_initial_positions(self):
         
-        positions = pd.DataFrame(columns = ['x', 'y'])
-        positions['x'] = np.ones(self.num_initial)*self.initial_position[0]
-        positions['y'] = np.ones(self.num_initial)*self.initial_position[1]
+        # the alive ants are always the first rows of the buffer
+        self._buffer = np.zeros((self.num_initial, 2), dtype=np.int32)
+        positions = self._buffer[:self.num_initial]
         
         return positions
 
+    def coordinates(self):
+        """
+        Returns the coordinates of the alive ants
+        """
+        return self.origin + self.positions
+
+    def occupied_positions(self):
+        """
+        Returns the coordinates of the occupied positions and the number of 
+        ants on each of them
+        """
+        if len(self.positions)==0:
+            return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+        # count the ants on the bounding box of their positions
+        low = self.positions.min(axis=0)
+        shape = self.positions.max(axis=0) - low + 1
+        offsets = self.positions - low
+        counts = np.bincount(offsets[:, 0]*shape[1] + offsets[:, 1], minlength=shape.prod())
+        occupied = np.flatnonzero(counts)
+        coords = np.stack(np.divmod(occupied, shape[1]), axis=1) + low + self.origin
+        
+        return coords, counts[occupied]
+
+    @property
+    def position_summary(self):
+        """
+        Current number of ants on each occupied position
+        """
+        import pandas as pd
+        coords, counts = self.occupied_positions()
+        index = pd.MultiIndex.from_arrays([coords[:, 0], coords[:, 1]], names=['x', 'y'])
+        
+        return pd.Series(data=counts, index=index).sort_values(ascending=False)
+
     def move(self, constraints):
         
         self.step +=1
+        profiler.count('ants_moved', len(self.positions), phase='move')
         
+        if self.estimator is not None:
+            with profiler.phase('move.estimator'):
+                if self.estimator.h is None:
+                    self.estimator.initialize(self, constraints)
+                self.estimator.before_move(self.positions)
         # make move and check alive ants
-        moves = self.possible_moves[np.random.choice(4, self.alive[self.step-1])]
-        self.positions += moves
-        is_alive = self.positions.apply(lambda pos: constraints(pos['x'], pos['y']), axis=1)
-        self.positions = self.positions[is_alive]
-        self.position_summary = self.positions.value_counts()
+        with profiler.phase('move.sample'):
+            kernel = constraints.kernel
+            moves = kernel.offsets[kernel.sample(self.rng, self.alive[self.step-1])]
+            self.positions += moves
+        with profiler.phase('move.constraints'):
+            is_alive = constraints.evaluate_lattice(self.positions, self.origin)
+        if self.estimator is not None:
+            with profiler.phase('move.estimator'):
+                self.estimator.after_move(self.step, self.positions, is_alive)
+        # move the alive ants at the beginning of the buffer
+        with profiler.phase('move.compact'):
+            num_alive = int(is_alive.sum())
+            self._buffer[:num_alive] = self.positions[is_alive]
+            self.positions = self._buffer[:num_alive]
         # calculate metrics
-        self.dead[self.step] = (~is_alive).astype(int).sum()
-        self.alive[self.step] = self.alive[self.step-1] - self.dead[self.step]
+        with profiler.phase('move.distance'):
+            distance = self.total_distance2boundary(constraints)
+        with profiler.phase('move.metrics'):
+            metrics = self.update_history(
+                dead = len(is_alive) - num_alive, 
+                distance = distance, 
+                constraints = constraints
+                )
+        
+        return self.dead[self.step], metrics
+
+    def any_alive(self):
+        """
+        Returns True while there are alive ants to move
+        """
+        return self.alive[self.step]>0
+
+    def update_history(self, dead:int, distance:float, constraints, alive:float=None):
+        """
+        Stores the ants dead at the current step and the total distance of 
+        the alive ants from the boundary, then updates the metrics. If the
+        alive ants are given the dead ants are the difference with the
+        previous step, so the rounding errors of the fractional ants do not
+        build up.
+        """
+        # double the history buffer when it is full
+        if self.step>=len(self._history):
+            history = np.zeros(2*len(self._history), dtype=self._history.dtype)
+            history[:len(self._history)] = self._history
+            self._history = history
+        if alive is not None:
+            alive = np.asarray(alive).item()
+            dead = self.alive[self.step-1] - alive
+        # python numbers keep the running sums exact for integer counts
+        dead = np.asarray(dead).item()
+        self.dead[self.step] = dead
+        self.alive[self.step] = self.alive[self.step-1] - self.dead[self.step] if alive is None else alive
         self.alive_perc[self.step] = self.alive[self.step]/self.num_initial
         self.dead_perc[self.step] = 1 - self.alive_perc[self.step]
-        metrics = self.calculate_metrics(constraints)
+        self.distance[self.step] = distance
+        self.sum_times += dead*self.step
+        self.sum_squared_times += dead*self.step**2
         
-        return self.dead[self.step], metrics
+        return self.calculate_metrics(constraints)
+
+    @classmethod
+    def merge(cls, shards:list, constraints):
+        """
+        Returns the ants obtained joining independent simulations of ants 
+        starting from the same position. The history is recalculated over
+        the whole population.
+        """
+        num_initial = sum(shard.num_initial for shard in shards)
+        last = max(shard.step for shard in shards)
+        ants = cls(num_initial, shards[0].initial_position, max_steps=last)
+        ants._buffer = np.concatenate([shard.positions for shard in shards])
+        ants.positions = ants._buffer
+        # the shards that ended earlier have no more deaths
+        dead = np.zeros(last+1, dtype=np.int64)
+        distance = np.zeros(last+1)
+        for shard in shards:
+            dead[:shard.step+1] += shard.dead
+            distance[:shard.step+1] += shard.distance
+        for step in range(1, last+1):
+            ants.step = step
+            ants.update_history(
+                dead = dead[step],
+                distance = distance[step],
+                constraints = constraints
+                )
+        
+        return ants
     
     
     def plot_alive_history_plot(self, max_steps:int=None, ax=None, **plt_kwargs):
         
         if ax is None:
+            import matplotlib.pyplot as plt
             ax = plt.gca()
 
         # percentage of alive ants per step
-        perc_history = np.array(list(self.alive.values()))/self.num_initial
+        perc_history = self.alive/self.num_initial
 
         ax.plot(perc_history, **plt_kwargs)
 
@@ -142,10 +349,11 @@ class Ants():
     def plot_death_history(self, max_steps:int=None, ax=None, **plt_kwargs):
 
         if ax is None:
+            import matplotlib.pyplot as plt
             ax = plt.gca()
         
         # percentage of ants that die per turn
-        perc_history = np.array(list(self.dead.values()))/self.num_initial
+        perc_history = self.dead/self.num_initial
 
         ax.clear()
 
@@ -161,29 +369,31 @@ class Ants():
         return ax
     
     
+    def total_distance2boundary(self, constraints):
+        if len(self.positions) == 0:
+            return 0
+
+        return constraints.lattice_distance(self.positions, self.origin).sum()
+
     def avg_distance2boundary(self, constraints):
-        if self.position_summary.shape[0] == 0:
+        if self.alive[self.step] == 0:
             return 0
-        aux = self.position_summary.copy()
-        aux = aux.reset_index()
-        aux['dist'] = aux.apply(
-            lambda z: constraints.closest_boundary[(z['x'], z['y'])][1]*z[0], 
-            axis=1
-            )
-
-        return aux['dist'].sum()/self.alive[self.step]
+
+        return self.distance[self.step]/self.alive[self.step]
     
     def calculate_lower_bound(self, constraints):
         # simple lower bound with +1
         # return self.mu[self.step] + (self.step+1-self.mu[self.step])*self.alive[self.step]/self.num_initial
-        # more precise lower bound with the distance to the closest boundary point
-        aux = self.step + self.avg_distance2boundary(constraints) - self.mu[self.step]
+        # more precise lower bound with the distance to the closest boundary point,
+        # a move covers at most kernel.reach unit steps
+        aux = self.step + self.avg_distance2boundary(constraints)/constraints.kernel.reach - self.mu[self.step]
         return self.mu[self.step] + aux*self.alive[self.step]/self.num_initial
     
     
     def calculate_metrics(self, constraints):
         """
-        Calculates, stores and returns the metrics: mu, sigma, upper_bound, lower_bound
+        Calculates, stores and returns the metrics: mu, sigma, upper_bound, lower_bound.
+        mu and sigma are updated in constant time from the running sums of the death times.
         """
 
         total_dead = self.num_initial - self.alive[self.step]
@@ -194,11 +404,11 @@ class Ants():
             self.lower_bound[self.step] = np.nan
             self.upper_bound[self.step] = np.nan
         else:
-            total_dead = self.num_initial - self.alive[self.step]
-            aux = [self.dead[t]*t/total_dead for t in self.dead.keys()]
-            self.mu[self.step] = np.sum(aux)
-            aux = [(self.dead[t]*(t-self.mu[self.step])**2)/(total_dead*(total_dead-1)) for t in self.dead.keys()] 
-            self.sigma[self.step] = np.sqrt(np.sum(aux))
+            total_dead = np.asarray(total_dead).item()
+            self.mu[self.step] = self.sum_times/total_dead
+            # sum of dead*(t-mu)**2 multiplied by total_dead, without rounding errors
+            aux = self.sum_squared_times*total_dead - self.sum_times**2
+            self.sigma[self.step] = np.sqrt(aux/(total_dead**2*(total_dead-1)))
             self.lower_bound[self.step] = self.calculate_lower_bound(constraints)
             self.upper_bound[self.step] = self.mu[self.step] + self.step*self.alive[self.step]/total_dead
         metrics = {
@@ -220,32 +430,418 @@ class Ants():
         info = {
             'step': step,
             'total': self.num_initial,
-            'alive': int(self.alive[step]), 
+            'alive': np.round(self.alive[step], decimals).item(), 
             'alive%': np.round(self.alive_perc[step], decimals),
-            'death_now': int(self.dead[step]),
+            'death_now': np.round(self.dead[step], decimals).item(),
             'death%': np.round(self.dead_perc[step], decimals),
             'mu': np.round(self.mu[step], decimals),
             'sigma': np.round(self.sigma[step], decimals),
             'lower_bound': np.round(self.lower_bound[step], decimals),
             'upper_bound': np.round(self.upper_bound[step], decimals)
             }
+        if self.estimator is not None and self.estimator.h is not None:
+            mu, sigma = self.estimator.estimate(step)
+            info['mu_cv'] = np.round(mu, decimals)
+            info['sigma_cv'] = np.round(sigma, decimals)
         
         return info
     
-    def get_history(self):
+    @property
+    def records(self):
+        """
+        Structured array with the history up to the current step (no copy)
+        """
+        return self._history[:self.step+1]
+
+    def get_history(self, start:int=0, stop:int=None):
         """
-        Returns the whole historical data regarding the useful metadata
+        Returns the historical data regarding the useful metadata from the step 
+        start to the step before stop (the current step if not given)
         """
-        history = pd.DataFrame(index=self.dead.keys())
-        history['alive'] = self.alive.values()
-        history['alive_perc'] = self.alive_perc.values()
-        history['dead'] = self.dead.values()
-        history['dead_perc'] = self.dead_perc.values()
-        history['mu'] = self.mu.values()
-        history['sigma'] = self.sigma.values()
-        history['lower_bound'] = self.lower_bound.values()
-        history['upper_bound'] = self.upper_bound.values()
+        import pandas as pd
+        stop = self.step+1 if stop is None else min(stop, self.step+1)
+        columns = [name for name in self.history_dtype.names if name!='distance']
+        history = pd.DataFrame(self._history[start:stop][columns], index=pd.RangeIndex(start, stop))
+        if self.estimator is not None and self.estimator.h is not None:
+            estimates = np.array([self.estimator.estimate(step) for step in range(start, stop)]).reshape(-1, 2)
+            history['mu_cv'] = estimates[:, 0]
+            history['sigma_cv'] = estimates[:, 1]
 
         return history
 
+    def to_arrays(self):
+        """
+        Returns the state of the simulation as arrays: positions, step, history,
+        running sums, state of the random generator and of the estimator
+        """
+        arrays = {
+            'num_initial': np.array(self.num_initial),
+            'initial_position': np.array(self.initial_position, dtype=float),
+            'step': np.array(self.step),
+            'history': self.records,
+            # python numbers, exact also beyond 64 bits
+            'sums': np.array(json.dumps([self.sum_times, self.sum_squared_times])),
+            'rng_state': np.array(rng_state(self.rng)),
+            }
+        if self.positions is not None:
+            arrays['positions'] = self.positions
+        if self.estimator is not None and self.estimator.h is not None:
+            arrays.update({f'estimator_{name}': array for name, array in self.estimator.to_arrays().items()})
+
+        return arrays
+
+    def from_arrays(self, arrays:dict, constraints=None):
+        """
+        Restores the state of the simulation from arrays
+        """
+        if int(arrays['num_initial'])!=self.num_initial or \
+            not np.array_equal(arrays['initial_position'], self.origin):
+            raise ValueError("Error: the saved ants have a different number or initial position")
+        self.step = int(arrays['step'])
+        history = arrays['history']
+        self._history = np.zeros(max(len(self._history), 2*len(history)), dtype=self.history_dtype)
+        self._history[:len(history)] = history
+        self.sum_times, self.sum_squared_times = json.loads(str(arrays['sums']))
+        set_rng_state(self.rng, str(arrays['rng_state']))
+        if 'positions' in arrays:
+            positions = arrays['positions']
+            self._buffer = np.zeros((self.num_initial, 2), dtype=np.int32)
+            self._buffer[:len(positions)] = positions
+            self.positions = self._buffer[:len(positions)]
+        if self.estimator is not None:
+            prefix = 'estimator_'
+            self.estimator.from_arrays({
+                name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)
+                })
+
+        return self
+
+
+
+
+class AntsCounts(Ants):
+    """
+    A class used to represent a population of ants through the number of ants
+    on each lattice point instead of the position of each ant. 
+    At each step the ants on each inside point are split among the moves of
+    the kernel of the constraints, drawing the numbers from a multinomial distribution (stochastic)
+    or using their expected fractions (deterministic). The cost of a step 
+    depends on the size of the domain and not on the number of ants.
+
+    ...
+
+    Attributes
+    ----------
+    stochastic : bool
+        if True the moves are random, otherwise the expected number of ants
+        follows each move and the numbers of ants become fractional
+    tol : float
+        fraction of alive ants below which the deterministic simulation stops
+    counts : np.array
+        number of ants on each point of the lookup table of the constraints
+    shift : np.array
+        position of the initial position in the counts table
+
+    The other attributes and methods are inherited from Ants.
+    """
+
+
+    def __init__(self, n:int, initial_position:tuple=(0,0), rng=None, max_steps:int=None, stochastic:bool=True, tol:float=1e-12) -> None:
+        
+        self.stochastic = stochastic
+        self.tol = tol
+        if not stochastic:
+            self.history_dtype = FRACTIONAL_HISTORY_DTYPE
+        # the table is created at the first move, when the constraints are known
+        self.counts = None
+        self.shift = None
+        super().__init__(n, initial_position, rng=rng, max_steps=max_steps)
+
+    def set_initial_positions(self):
+        
+        # the ants are not tracked one by one
+        return None
+
+    def initialize_counts(self, constraints):
+        """
+        Places all the ants on the initial position of the lookup table of the constraints
+        """
+        self.shift = constraints.lattice_shift(self.origin)
+        if self.shift is None:
+            raise ValueError("The initial position is not on the lattice of the inside points")
+        self.counts = np.zeros(constraints.lookup.shape, dtype=np.int64 if self.stochastic else float)
+        self.counts[tuple(self.shift)] = self.num_initial
+
+        return self.counts
 
+    def occupied_positions(self):
+        """
+        Returns the coordinates of the occupied positions and the number of 
+        ants on each of them
+        """
+        if self.counts is None:
+            return self.origin[None, :], np.array([self.num_initial])
+        occupied = np.argwhere(self.counts)
+        coords = occupied - self.shift + self.origin
+        
+        return coords, self.counts[occupied[:, 0], occupied[:, 1]]
+
+    def any_alive(self):
+        """
+        Returns True while there are alive ants, at least tol times the
+        initial ants if the numbers of ants are fractional
+        """
+        if self.stochastic:
+            return self.alive[self.step]>0
+        return self.alive[self.step]>self.tol*self.num_initial
+
+    def split_counts(self, kernel):
+        """
+        Returns the number of ants following each move of the kernel from each point
+        """
+        if not self.stochastic:
+            return [self.counts*p for p in kernel.probabilities]
+        # multinomial split as a chain of binomial draws
+        parts = []
+        remaining = self.counts
+        left = 1.
+        for p in kernel.probabilities[:-1]:
+            parts.append(self.rng.binomial(remaining, min(p/left, 1.)))
+            remaining = remaining - parts[-1]
+            left -= p
+        parts.append(remaining)
+        
+        return parts
+
+    def move(self, constraints):
+        
+        self.step +=1
+        
+        if self.counts is None:
+            self.initialize_counts(constraints)
+        profiler.count('ants_moved', self.alive[self.step-1], phase='move')
+        # make move
+        with profiler.phase('move.sample'):
+            counts = np.zeros_like(self.counts)
+            height, width = counts.shape
+            kernel = constraints.kernel
+            for (dx, dy), part in zip(kernel.offsets, self.split_counts(kernel)):
+                # every move from an inside point lands on an inside or boundary 
+                # point of the table, so no ant is lost cutting the shifted table
+                counts[max(dx,0):height+min(dx,0), max(dy,0):width+min(dy,0)] += \
+                    part[max(-dx,0):height+min(-dx,0), max(-dy,0):width+min(-dy,0)]
+        # the ants outside the inside points are dead
+        with profiler.phase('move.constraints'):
+            dead = counts[~constraints.lookup].sum()
+            counts[~constraints.lookup] = 0
+            self.counts = counts
+        # calculate metrics
+        with profiler.phase('move.distance'):
+            distance = self.total_distance2boundary(constraints)
+        with profiler.phase('move.metrics'):
+            metrics = self.update_history(
+                dead = dead, 
+                distance = distance, 
+                constraints = constraints,
+                # the fractional alive ants are summed again at each step
+                alive = None if self.stochastic else self.counts.sum()
+                )
+        
+        return self.dead[self.step], metrics
+
+    def total_distance2boundary(self, constraints):
+        if self.counts is None:
+            return 0
+        if constraints.distance_map is None:
+            constraints.find_closest_boundary()
+        inside = constraints.lookup
+
+        return (self.counts[inside]*constraints.distance_map[inside]).sum()
+
+    def to_arrays(self):
+        
+        arrays = super().to_arrays()
+        if self.counts is not None:
+            arrays['counts'] = self.counts
+            arrays['shift'] = self.shift
+
+        return arrays
+
+    def from_arrays(self, arrays:dict, constraints=None):
+
+        super().from_arrays(arrays, constraints)
+        if 'counts' in arrays:
+            self.counts = arrays['counts']
+            self.shift = arrays['shift']
+
+        return self
+
+
+class AntsDistribution(Ants):
+    """
+    A class used to represent the exact probability distribution of the
+    position of the ants. 
+    At each step the probabilities of the inside points are propagated with
+    the sparse transition matrix, so the history contains the exact number of
+    alive and dead ants per each step, the exact average time (mu) and the 
+    standard deviation of the time (std) that the dead ants needed to reach 
+    the food. As in the other simulations sigma is the standard error of mu,
+    which is 0 for the exact distribution. The propagation stops when the alive ants are less than tol 
+    times the initial number of ants.
+
+    ...
+
+    Attributes
+    ----------
+    tol : float
+        fraction of alive ants below which the propagation stops
+    probability : np.array
+        probability of each inside point, in the order of points
+    points : list
+        inside points in the order of the transition matrix
+    transition : scipy.sparse.csr_matrix
+        transposed transition matrix between the inside points
+    exit_probability : np.array
+        probability to leave the inside points from each inside point
+    points_distance : np.array
+        distance of each inside point from its closest boundary point
+    std : np.array
+        standard deviation (per each time step) of the time that the dead ants needed to reach the food
+
+    The other attributes and methods are inherited from Ants.
+    """
+
+    history_dtype = DISTRIBUTION_HISTORY_DTYPE
+    std = history_column('std')
+
+
+    def __init__(self, n:float=1, initial_position:tuple=(0,0), max_steps:int=None, tol:float=1e-12) -> None:
+        
+        self.tol = tol
+        # the distribution is created at the first move, when the constraints are known
+        self.probability = None
+        self.points = None
+        self.transition = None
+        self.exit_probability = None
+        self.points_distance = None
+        super().__init__(n, initial_position, max_steps=max_steps)
+
+    def set_initial_positions(self):
+        
+        # the ants are not tracked one by one
+        return None
+
+    def initialize_probability(self, constraints, points:list=None):
+        """
+        Builds the transition matrix (between points, if given, in their order)
+        and places all the ants on the initial position
+        """
+        M, self.points = transition_matrix(constraints, points)
+        self.transition = M.T.tocsr()
+        self.exit_probability = 1 - np.asarray(M.sum(axis=1)).ravel()
+        coords = np.array(self.points).reshape(-1, 2)
+        start = np.flatnonzero((coords==self.origin).all(axis=1))
+        if len(start)==0:
+            raise ValueError("The initial position is not an inside point")
+        self.probability = np.zeros(len(self.points))
+        self.probability[start] = 1.
+        offsets = np.rint(coords - self.origin).astype(np.int64)
+        self.points_distance = constraints.lattice_distance(offsets, self.origin)
+
+        return self.probability
+
+    def occupied_positions(self):
+        """
+        Returns the coordinates of the occupied positions and the expected
+        number of ants on each of them
+        """
+        if self.probability is None:
+            return self.origin[None, :], np.array([self.num_initial])
+        occupied = np.flatnonzero(self.probability)
+        coords = np.array(self.points).reshape(-1, 2)[occupied]
+
+        return coords, self.probability[occupied]*self.num_initial
+
+    def any_alive(self):
+        """
+        Returns True while the alive ants are at least tol times the initial ants
+        """
+        return self.alive[self.step]>self.tol*self.num_initial
+
+    def move(self, constraints):
+        
+        self.step +=1
+        
+        if self.probability is None:
+            self.initialize_probability(constraints)
+        # the dead ants are the ones leaving the inside points
+        with profiler.phase('move.transition'):
+            dead = (self.probability*self.exit_probability).sum()
+            self.probability = self.transition @ self.probability
+        # calculate metrics
+        with profiler.phase('move.metrics'):
+            metrics = self.update_history(
+                dead = dead*self.num_initial, 
+                distance = (self.probability*self.points_distance).sum()*self.num_initial, 
+                constraints = constraints
+                )
+        
+        return self.dead[self.step], metrics
+
+    def to_arrays(self):
+        
+        arrays = super().to_arrays()
+        if self.probability is not None:
+            arrays['probability'] = self.probability
+            arrays['points'] = np.array(self.points, dtype=float).reshape(-1, 2)
+
+        return arrays
+
+    def from_arrays(self, arrays:dict, constraints=None):
+
+        super().from_arrays(arrays, constraints)
+        if 'probability' in arrays:
+            # the order of the points fixes the order of the sums
+            points = [tuple(point) for point in arrays['points'].tolist()]
+            self.initialize_probability(constraints, points)
+            self.probability = arrays['probability']
+
+        return self
+
+    def calculate_metrics(self, constraints):
+        """
+        Calculates, stores and returns the metrics: mu, sigma, std, upper_bound, lower_bound.
+        mu and std are the exact mean and standard deviation of the time 
+        to reach the food of the dead ants, the standard error sigma is 0.
+        """
+
+        total_dead = self.num_initial - self.alive[self.step]
+        if total_dead <= 0:
+            self.mu[self.step] = np.nan
+            self.sigma[self.step] = np.nan
+            self.std[self.step] = np.nan
+            self.lower_bound[self.step] = np.nan
+            self.upper_bound[self.step] = np.nan
+        else:
+            self.mu[self.step] = self.sum_times/total_dead
+            variance = self.sum_squared_times/total_dead - self.mu[self.step]**2
+            self.sigma[self.step] = 0.
+            self.std[self.step] = np.sqrt(max(variance, 0.))
+            self.lower_bound[self.step] = self.calculate_lower_bound(constraints)
+            self.upper_bound[self.step] = self.mu[self.step] + self.step*self.alive[self.step]/total_dead
+        metrics = {
+            'step': self.step, 
+            'mu': self.mu[self.step], 
+            'sigma': self.sigma[self.step], 
+            'std': self.std[self.step], 
+            'lower_bound': self.lower_bound[self.step],
+            'upper_bound': self.upper_bound[self.step]
+            }
+        return metrics
+
+    def get_info(self, step:int=None, decimals:int=3):
+        
+        info = super().get_info(step, decimals)
+        info['std'] = np.round(self.std[info['step']], decimals)
+
+        return info
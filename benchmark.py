@@ -0,0 +1,243 @@
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tracemalloc
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+# scales of the ellipses (about 38*scale**2 inside points) and numbers of ants
+SUITES = {
+    'quick': {'scales': [1, 5, 16], 'ants': [10**3, 10**4, 10**5]},
+    'full': {'scales': [1, 5, 16, 50, 163], 'ants': [10**3, 10**4, 10**5, 10**6, 10**7, 10**8]},
+    }
+# domain of the benchmarks of the ants
+ANTS_SCALE = 16
+NUM_MOVES = 10
+GRID_SIZE = 101
+
+
+def ellipse_constraints(scale:int, explore:bool=True):
+    """
+    Returns the constraints of the ellipse of the boundary_func.ellipse
+    family with the axes multiplied by scale, with the domain already explored
+    """
+    from boundary_func import Ellipse
+    from constraints import Constraint
+    constraints = Constraint(Ellipse(axes=(3*scale, 4*scale)), mode='lookup')
+    if explore:
+        # the exploration prints the number of points
+        with contextlib.redirect_stdout(io.StringIO()):
+            constraints.evaluate_points(start_points={(0., 0.)}, max_iter=50*scale**2 + 1000)
+    return constraints
+
+
+def moved_ants(n:int, constraints, num_moves:int=NUM_MOVES):
+    """
+    Returns n ants after num_moves moves in the constraints
+    """
+    from ants import Ants
+    ants = Ants(n, (0., 0.), rng=np.random.default_rng(0), max_steps=num_moves)
+    for _ in range(num_moves):
+        ants.move(constraints)
+    return ants
+
+
+# each benchmark returns the functions to prepare the state (not measured)
+# and to run the measured code on the state, and the number of calls of run
+
+def bench_evaluate_points(scale:int):
+    def run(constraints):
+        with contextlib.redirect_stdout(io.StringIO()):
+            constraints.evaluate_points(start_points={(0., 0.)}, max_iter=50*scale**2 + 1000)
+    return (lambda: ellipse_constraints(scale, explore=False)), run, 1
+
+
+def bench_find_closest_boundary(scale:int):
+    def run(constraints):
+        constraints.find_closest_boundary()
+    return (lambda: ellipse_constraints(scale)), run, 1
+
+
+def bench_exact_solution(scale:int):
+    from solver import calculate_exact_solution
+    def run(constraints):
+        calculate_exact_solution(constraints, (0., 0.), method='direct')
+    return (lambda: ellipse_constraints(scale)), run, 1
+
+
+def bench_multigrid_solution(scale:int):
+    from solver import calculate_exact_solution
+    def run(constraints):
+        calculate_exact_solution(constraints, (0., 0.), method='multigrid')
+    return (lambda: ellipse_constraints(scale)), run, 1
+
+
+def bench_ants_move(n:int):
+    from ants import Ants
+    def prepare():
+        constraints = ellipse_constraints(ANTS_SCALE)
+        constraints.find_closest_boundary()
+        return constraints, Ants(n, (0., 0.), rng=np.random.default_rng(0), max_steps=NUM_MOVES)
+    def run(state):
+        constraints, ants = state
+        for _ in range(NUM_MOVES):
+            ants.move(constraints)
+    return prepare, run, NUM_MOVES
+
+
+def bench_update_grid(n:int):
+    from grid import Grid
+    def prepare():
+        constraints = ellipse_constraints(ANTS_SCALE)
+        constraints.find_closest_boundary()
+        changes = moved_ants(n, constraints).position_summary
+        return Grid(GRID_SIZE, GRID_SIZE), changes
+    def run(state):
+        grid, changes = state
+        grid.update_grid(changes)
+    return prepare, run, 1
+
+
+BENCHMARKS = {
+    'evaluate_points': (bench_evaluate_points, 'scales'),
+    'find_closest_boundary': (bench_find_closest_boundary, 'scales'),
+    'exact_solution': (bench_exact_solution, 'scales'),
+    'multigrid_solution': (bench_multigrid_solution, 'scales'),
+    'ants_move': (bench_ants_move, 'ants'),
+    'update_grid': (bench_update_grid, 'ants'),
+    }
+
+
+def run_case(name:str, param:int, repeat:int):
+    """
+    Runs a benchmark and returns the best wall time per call over repeat
+    runs, the peak of the memory allocated by a traced run and the peak
+    resident memory of the process
+    """
+    # the modules imported lazily are loaded before the measures
+    import pandas
+    import scipy.sparse.linalg
+    benchmark, params = BENCHMARKS[name]
+    prepare, run, calls = benchmark(param)
+    times = []
+    for _ in range(repeat):
+        state = prepare()
+        start = time.perf_counter()
+        run(state)
+        times.append((time.perf_counter() - start)/calls)
+    # the allocations are traced in a separate run, tracing slows down the code
+    state = prepare()
+    tracemalloc.start()
+    run(state)
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = param
+    if params=='scales':
+        size = len(state.inside_points)
+    return {
+        'name': name,
+        'param': param,
+        'size': size,
+        'wall_time': min(times),
+        'peak_alloc': peak_alloc,
+        # kilobytes on Linux
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024,
+        }
+
+
+def run_suite(suite:str='quick', names:list=None, repeat:int=3):
+    """
+    Runs the benchmarks of the suite, each one in a new process so that the
+    peak resident memory is measured separately
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name in names or BENCHMARKS:
+        _, params = BENCHMARKS[name]
+        for param in SUITES[suite][params]:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_case, name, param, repeat).result()
+            print(f"{result['name']:<24}{result['size']:>12}{result['wall_time']:>14.6f} s"
+                  f"{result['peak_alloc']/2**20:>12.1f} MiB{result['peak_rss']/2**20:>12.1f} MiB")
+            results.append(result)
+    return results
+
+
+def environment():
+    """
+    Returns the versions of the libraries and the machine running the benchmarks
+    """
+    import scipy
+    import pandas
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'pandas': pandas.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': multiprocessing.cpu_count(),
+        }
+
+
+def compare(results:list, baseline:list, tolerance:float=0.25, min_time:float=1e-3):
+    """
+    Returns the regressions of the results with respect to the baseline: the
+    wall times and the allocations larger than the baseline by more than
+    tolerance (the wall times also by more than min_time seconds)
+    """
+    reference = {(r['name'], r['param']): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = reference.get((result['name'], result['param']))
+        if base is None:
+            continue
+        slower = result['wall_time'] - base['wall_time']
+        if slower>tolerance*base['wall_time'] and slower>min_time:
+            regressions.append((result['name'], result['param'], 'wall_time', base['wall_time'], result['wall_time']))
+        if result['peak_alloc']>(1 + tolerance)*base['peak_alloc']:
+            regressions.append((result['name'], result['param'], 'peak_alloc', base['peak_alloc'], result['peak_alloc']))
+    return regressions
+
+
+def main(argv:list=None):
+
+    parser = argparse.ArgumentParser(description='Runs the benchmarks and compares them with a baseline')
+    parser.add_argument('--suite', choices=list(SUITES), default='quick')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each benchmark, the best time is kept')
+    parser.add_argument('--output', default='output/benchmark.json', help='JSON file of the results')
+    parser.add_argument('--baseline', help='JSON file of the results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    args = parser.parse_args(argv)
+
+    print(f"{'benchmark':<24}{'size':>12}{'wall time':>16}{'peak alloc':>16}{'peak rss':>16}")
+    results = run_suite(args.suite, args.only, args.repeat)
+    report = {'suite': args.suite, 'environment': environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, param, metric, before, after in regressions:
+            print(f'REGRESSION {name} ({param}) {metric}: {before:.6g} -> {after:.6g}')
+        if regressions:
+            sys.exit(f'Error: {len(regressions)} regressions with respect to {args.baseline}')
+        print('No regressions')
+
+    return report
+
+
+if __name__=="__main__":
+
+    main()
@@ -1,5 +1,8 @@
+import numpy as np
+
+
 def square(x, y):
-    f = (-2<x<2) and (-2<y<2)
+    f = (-2<x) & (x<2) & (-2<y) & (y<2)
     return f
 
 def half_plane(x, y):
@@ -9,3 +12,69 @@ def half_plane(x, y):
 def ellipse(x, y):
     f = ((x - 0.25)**2/9 + (y - 0.25)**2/16 -1) < 0
     return f
+
+
+# parameterized families of boundaries
+# (classes instead of closures, so they can be sent to other processes)
+
+class Ellipse():
+    def __init__(self, center:tuple=(0.25, 0.25), axes:tuple=(3, 4)) -> None:
+        self.center = tuple(center)
+        self.axes = tuple(axes)
+
+    def __call__(self, x, y):
+        f = ((x - self.center[0])**2/self.axes[0]**2 + (y - self.center[1])**2/self.axes[1]**2 -1) < 0
+        return f
+
+    def __repr__(self) -> str:
+        return f'Ellipse(center={self.center}, axes={self.axes})'
+
+
+class Rectangle():
+    def __init__(self, x_min:float=-2, x_max:float=2, y_min:float=-2, y_max:float=2) -> None:
+        self.x_min = x_min
+        self.x_max = x_max
+        self.y_min = y_min
+        self.y_max = y_max
+
+    def __call__(self, x, y):
+        f = (self.x_min<x) & (x<self.x_max) & (self.y_min<y) & (y<self.y_max)
+        return f
+
+    def __repr__(self) -> str:
+        return f'Rectangle(x_min={self.x_min}, x_max={self.x_max}, y_min={self.y_min}, y_max={self.y_max})'
+
+
+class HalfPlane():
+    def __init__(self, a:float=1, b:float=1, c:float=-1) -> None:
+        self.a = a
+        self.b = b
+        self.c = c
+
+    def __call__(self, x, y):
+        f = (self.a*x + self.b*y + self.c < 0)
+        return f
+
+    def __repr__(self) -> str:
+        return f'HalfPlane(a={self.a}, b={self.b}, c={self.c})'
+
+
+class Polygon():
+    def __init__(self, vertices:list=((-2, -2), (2, -2), (2, 2), (-2, 2))) -> None:
+        assert len(vertices)>=3
+        self.vertices = tuple(tuple(v) for v in vertices)
+
+    def __call__(self, x, y):
+        # even-odd rule: count the edges crossed by the horizontal ray from the point
+        x = np.asarray(x)
+        y = np.asarray(y)
+        f = np.zeros(np.broadcast(x, y).shape, dtype=bool)
+        for (x1, y1), (x2, y2) in zip(self.vertices, self.vertices[1:] + self.vertices[:1]):
+            if y1==y2:
+                continue
+            crossing = (y1>y) != (y2>y)
+            f ^= crossing & (x < x1 + (x2-x1)*(y-y1)/(y2-y1))
+        return f[()]
+
+    def __repr__(self) -> str:
+        return f'Polygon(vertices={self.vertices})'
@@ -0,0 +1,118 @@
+import os
+import json
+import hashlib
+import inspect
+import numpy as np
+
+
+def function_hash(function):
+    """
+    Returns a hash of the name and of the source code of the function.
+    For the instances of the parameterized boundaries the name includes
+    the parameters and the source is the one of their class.
+    """
+    name = f"{getattr(function, '__module__', '')}.{getattr(function, '__qualname__', repr(function))}"
+    code = function if inspect.isfunction(function) else type(function)
+    try:
+        source = inspect.getsource(code)
+    except (OSError, TypeError):
+        # functions without source file, e.g. defined in an interactive session
+        code = getattr(function, '__code__', None)
+        source = code.co_code.hex() if code is not None else repr(function)
+    return hashlib.sha256(f'{name}\n{source}'.encode()).hexdigest()
+
+
+class Cache():
+    """
+    A class used to represent an on-disk cache of NumPy arrays.
+    Each entry is a .npz file named after the hash of its parameters and the
+    least recently used entries are deleted when the cache exceeds max_size.
+    ...
+
+    Attributes
+    ----------
+    path : str
+        directory of the cache files
+    max_size : int
+        maximum size of the cache in bytes
+
+
+    Methods
+    -------
+    key(*parts)
+        Returns the key identifying the parameters
+    file(key)
+        Returns the path of the file of the entry
+    load(key)
+        Returns the arrays stored with key, None if they are not in the cache
+    save(key, **arrays)
+        Stores the arrays with key and evicts the least recently used entries
+    evict()
+        Deletes the least recently used entries until the cache fits max_size
+    """
+
+
+    def __init__(self, path:str='.cache', max_size:int=2**30) -> None:
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+
+    def key(self, *parts):
+        """
+        Returns the key identifying the parameters
+        """
+        text = json.dumps(parts, sort_keys=True, default=repr)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+
+    def file(self, key:str):
+        """
+        Returns the path of the file of the entry
+        """
+        return os.path.join(self.path, f'{key}.npz')
+
+
+    def load(self, key:str):
+        """
+        Returns the arrays stored with key, None if they are not in the cache
+        """
+        file = self.file(key)
+        if not os.path.exists(file):
+            return None
+        with np.load(file) as data:
+            arrays = {name: data[name] for name in data.files}
+        # mark the entry as recently used
+        os.utime(file)
+        return arrays
+
+
+    def save(self, key:str, **arrays):
+        """
+        Stores the arrays with key and evicts the least recently used entries
+        """
+        file = self.file(key)
+        # write to a temporary file first, so a crash never leaves broken entries
+        temporary = f'{file}.tmp.npz'
+        np.savez(temporary, **arrays)
+        os.replace(temporary, file)
+        self.evict()
+        return file
+
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits max_size
+        """
+        entries = [
+            entry for entry in os.scandir(self.path)
+            if entry.is_file() and entry.name.endswith('.npz')
+            ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if size<=self.max_size:
+                break
+            size -= entry.stat().st_size
+            os.remove(entry.path)
+        return size
@@ -0,0 +1,43 @@
+import os
+import numpy as np
+
+
+def save_checkpoint(path:str, ants, constraints):
+    """
+    Writes the whole state of the simulation (ants, random generator and
+    domain of the constraints) to a compressed .npz file. The file is
+    replaced atomically, so a crash never leaves a broken checkpoint.
+    """
+    arrays = {
+        'ants_class': np.array(type(ants).__name__),
+        'kernel': np.array(repr(constraints.kernel)),
+        }
+    arrays.update({f'ants_{name}': array for name, array in ants.to_arrays().items()})
+    arrays.update({f'constraint_{name}': array for name, array in constraints.to_arrays().items()})
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f'{path}.tmp.npz'
+    np.savez_compressed(temporary, **arrays)
+    os.replace(temporary, path)
+
+    return path
+
+
+def load_checkpoint(path:str, ants, constraints):
+    """
+    Restores the state of the simulation saved by save_checkpoint into ants
+    and constraints, which must be created with the same settings
+    """
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files}
+    if str(arrays['ants_class'])!=type(ants).__name__:
+        raise ValueError(f"Error: the checkpoint contains {arrays['ants_class']} instead of {type(ants).__name__}")
+    if str(arrays['kernel'])!=repr(constraints.kernel):
+        raise ValueError("Error: the checkpoint was saved with a different kernel")
+
+    def section(prefix:str):
+        return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+    constraints.from_arrays(section('constraint_'))
+    ants.from_arrays(section('ants_'), constraints)
+
+    return ants, constraints
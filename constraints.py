@@ -1,6 +1,135 @@
-from copy import copy
-from utils import neighbors as find_neighbors
-from utils import points_distance
+from collections.abc import Mapping
+import numpy as np
+from kernels import SIMPLE
+from profiler import profiler
+
+
+MODES = ('function', 'lookup')
+# labels of the flood fill table
+UNKNOWN, INSIDE, BOUNDARY = 0, 1, 2
+
+
+def vectorize(function):
+    """
+    Returns a version of the boundary function that accepts arrays of
+    coordinates and returns a boolean mask. The functions that already work
+    with arrays are returned unchanged, the scalar ones are wrapped.
+    A function can skip the check with a boolean 'vectorized' attribute.
+    """
+    vectorized = getattr(function, 'vectorized', None)
+    if vectorized is None:
+        x = np.array([0., 1., 2.])
+        y = np.array([0., 1., 2.])
+        try:
+            vectorized = np.shape(function(x, y))==x.shape
+        except (ValueError, TypeError):
+            vectorized = False
+    if vectorized:
+        return function
+    return np.vectorize(function, otypes=[bool])
+
+
+def flood_fill(evaluate, origin, start, max_points:int, print_iter:int=None, moves=SIMPLE.offsets):
+    """
+    Explores the lattice points origin+ij reachable from the start offsets 
+    with the moves, as a breadth first search evaluating the whole frontier at once.
+    Returns the table labelling the explored points as INSIDE or BOUNDARY, 
+    the lattice offsets of the first cell of the table and the number of 
+    inside points. The exploration stops when more than max_points inside
+    points are found.
+    """
+    start = np.unique(start, axis=0)
+    margin = 16
+    low = start.min(axis=0) - margin
+    state = np.zeros(start.max(axis=0) - low + margin + 1, dtype=np.int8)
+    state[start[:, 0] - low[0], start[:, 1] - low[1]] = INSIDE
+    frontier = start
+    num_inside = len(start)
+    level = 0
+
+    while len(frontier)>0 and num_inside<=max_points:
+        if print_iter!=None and level%print_iter == 0:
+            print(num_inside, end='\t')
+        level += 1
+        candidates = (frontier[:, None, :] + moves[None, :, :]).reshape(-1, 2)
+        # double the table when the candidates fall outside of it
+        high = low + state.shape
+        if (candidates.min(axis=0)<low).any() or (candidates.max(axis=0)>=high).any():
+            size = np.array(state.shape)
+            new_low = np.minimum(low, candidates.min(axis=0) - size//2)
+            new_high = np.maximum(high, candidates.max(axis=0) + 1 + size//2)
+            grown = np.zeros(new_high - new_low, dtype=np.int8)
+            shift = low - new_low
+            grown[shift[0]:shift[0]+size[0], shift[1]:shift[1]+size[1]] = state
+            state, low = grown, new_low
+        # evaluate only the points never seen before
+        cells = state.reshape(-1)
+        flat = np.ravel_multi_index((candidates - low).T, state.shape)
+        flat = np.unique(flat[cells[flat]==UNKNOWN])
+        ij = np.stack(np.unravel_index(flat, state.shape), axis=1) + low
+        is_inside = evaluate(origin[0] + ij[:, 0], origin[1] + ij[:, 1])
+        cells[flat] = np.where(is_inside, INSIDE, BOUNDARY)
+        frontier = ij[is_inside]
+        num_inside += len(frontier)
+
+    return state, low, num_inside
+
+
+def distance_transform(sources):
+    """
+    Returns the exact L1 distance of each cell of the table from the closest 
+    source cell and the indices of that source cell.
+    The L1 distance is separable, so it is calculated with a forward and a 
+    backward sweep along the columns and then along the rows of the table.
+    """
+    distance = np.where(sources, 0, sources.size).astype(np.int64)
+    closest = np.indices(sources.shape).transpose(1, 2, 0).copy()
+
+    for axis in (1, 0):
+        # move the axis to sweep in front, the views update the tables
+        d = np.moveaxis(distance, axis, 0)
+        c = np.moveaxis(closest, axis, 0)
+        n = d.shape[0]
+        sweeps = [(k, k-1) for k in range(1, n)] + [(k, k+1) for k in range(n-2, -1, -1)]
+        for k, previous in sweeps:
+            candidate = d[previous] + 1
+            better = candidate < d[k]
+            d[k][better] = candidate[better]
+            c[k][better] = c[previous][better]
+
+    return distance, closest
+
+
+class ClosestBoundary(Mapping):
+    """
+    A read-only dictionary with inside points coordinates as keys and their 
+    closest boundary point coordinates and the relative distance as values.
+    The values are read from the tables of the distance transform when needed.
+    """
+
+    def __init__(self, inside_points:set, distance_map, closest, origin) -> None:
+        self.inside_points = inside_points
+        self.distance_map = distance_map
+        self.closest = closest
+        self.origin = origin
+
+    def __getitem__(self, point):
+        ij = np.asarray(point, dtype=float) - self.origin
+        if ij.shape!=(2,) or not np.array_equal(ij, np.rint(ij)):
+            raise KeyError(point)
+        i, j = np.rint(ij).astype(np.int64)
+        if not (0<=i<self.distance_map.shape[0] and 0<=j<self.distance_map.shape[1]) \
+            or self.distance_map[i, j]<0:
+            raise KeyError(point)
+        best = self.closest[i, j] + self.origin
+        return (float(best[0]), float(best[1])), int(self.distance_map[i, j])
+
+    def __iter__(self):
+        return iter(self.inside_points)
+
+    def __len__(self):
+        return len(self.inside_points)
+
 
 class Constraint():
     """
@@ -13,94 +142,284 @@ class Constraint():
         function describing the boundaries. Given the coordinates of a point 
         the function returns a True value if the point respect the bouddaries, 
         False otherwise
+    vectorized : function
+        version of function that accepts arrays of coordinates and returns
+        a boolean mask
     inside_points : set
         dictionary with the coordinates of the points that respects the boundaries
     boundary_points : set
         dictionary with the coordinates of the points that do not respects the
-        boundaries and are at a distance of 1 step form the closest inside point
-    closest_boundary : dict
+        boundaries and are at a distance of 1 move form the closest inside point
+    closest_boundary : ClosestBoundary
         dictionary with inside points coordinates as keys and their closest 
         boundary point coordinates and the relative distance as values
+    kernel : kernels.Kernel
+        moves of the ants, which define the points reachable from the start
+    mode : str
+        how the membership of the ants is checked during the simulation:
+        'function' calls the boundary function, 'lookup' reads the lookup table
+    lookup : np.array
+        boolean table of the bounding box of the boundary points with True
+        values on the inside points
+    lookup_origin : np.array
+        coordinates of the point stored in lookup[0, 0]
+    distance_map : np.array
+        table aligned with lookup with the distance of each inside point from
+        its closest boundary point (-1 outside)
 
 
     Methods
     -------
-    __call__(*args, **kwds)
+    __call__(x, y)
         Calls the function describing the boundaries
+    evaluate(x, y)
+        Evaluates the function describing the boundaries on arrays of coordinates
     evaluate_points(start_points:set={(0,0)}, max_iter:int=1000, print_iter:int=None)
         Finds, updates and returns the inside and boundary points
     find_closest_boundary()
         Finds the closest boundary point and its distance per each inside point
+    build_lookup()
+        Builds the lookup table of the inside points
+    to_arrays()
+        Returns the points and the tables of the constraints as arrays
+    from_arrays(arrays:dict)
+        Restores the points and the tables of the constraints from arrays
+    evaluate_lattice(positions, origin)
+        Evaluates the lattice positions relative to origin according to the mode
+    lattice_shift(origin, dtype=np.int64)
+        Returns the offset from the lattice positions relative to origin to the lookup table
+    lattice_distance(positions, origin)
+        Returns the distance of the lattice positions relative to origin from the boundary
     """
 
 
-    def __init__(self, function) -> None:
+    def __init__(self, function, mode:str='function', kernel=None) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Error: 'mode' must be one of {MODES}")
         self.function = function
+        self.kernel = kernel if kernel is not None else SIMPLE
+        self.vectorized = vectorize(function) if function is not None else None
+        self.mode = mode
         self.inside_points = None
         self.boundary_points = None
         self.closest_boundary = None
+        self.distance_map = None
+        self.lookup = None
+        self.lookup_origin = None
     
     
-    def __call__(self, *args, **kwds):
-        return self.function(*args, **kwds)
+    def __call__(self, x, y):
+        # single points do not need the array machinery
+        if np.ndim(x)==0 and np.ndim(y)==0:
+            return self.function(x, y)
+        return self.evaluate(x, y)
     
+
+    def evaluate(self, x, y):
+        """
+        Returns the boolean mask of the coordinates that respect the boundaries
+        """
+        mask = np.asarray(self.vectorized(x, y), dtype=bool)
+        profiler.count('predicate_calls')
+        profiler.count('predicate_points', mask.size)
+        return mask
     
-    def evaluate_points(self, start_points:set={(0.,0.)}, max_iter:int=1000, print_iter:int=None):
+
+    def evaluate_lattice(self, positions, origin):
         """
-        Finds the inside and boundary points according to the constraint function
+        Returns the boolean mask of the positions that respect the boundaries.
+        The positions are integer lattice offsets from the origin coordinates.
         """
+        if self.mode=='lookup':
+            shift = self.lattice_shift(origin, positions.dtype)
+            if shift is not None:
+                return self.lookup[positions[:, 0] + shift[0], positions[:, 1] + shift[1]]
+        coords = origin + positions
+        return self.evaluate(coords[:, 0], coords[:, 1])
+    
 
-        inside_points = copy(start_points)
-        points_to_explore = copy(start_points)
-        bondary_points = set()
+    def lattice_shift(self, origin, dtype=np.int64):
+        """
+        Returns the offset to add to the lattice positions relative to origin 
+        to index the lookup table, None if origin is not on the lattice of the
+        inside points
+        """
+        if self.lookup is None:
+            self.build_lookup()
+        shift = np.asarray(origin) - self.lookup_origin
+        if not np.array_equal(shift, np.rint(shift)):
+            return None
+        return shift.astype(dtype)
+    
+
+    def lattice_distance(self, positions, origin):
+        """
+        Returns the distance of the lattice positions relative to origin from
+        their closest boundary point
+        """
+        if self.distance_map is None:
+            self.find_closest_boundary()
+        shift = self.lattice_shift(origin, positions.dtype)
+        if shift is None:
+            raise ValueError("The positions are not on the lattice of the inside points")
+        return self.distance_map[positions[:, 0] + shift[0], positions[:, 1] + shift[1]]
+    
+
+    def build_lookup(self):
+        """
+        Builds the lookup table of the inside points on the bounding box of 
+        the boundary points. The positions that leave the inside points by one
+        move are always boundary points, so they are always in the table.
+        """
+        if self.inside_points is None or self.boundary_points is None:
+            raise ValueError("No inside_points or boundary_points detected")
+
+        inside = np.array(list(self.inside_points), dtype=float).reshape(-1, 2)
+        boundary = np.array(list(self.boundary_points), dtype=float).reshape(-1, 2)
+        points = np.concatenate([inside, boundary])
+        origin = points.min(axis=0)
+        shape = np.rint(points.max(axis=0) - origin).astype(np.int64) + 1
+        ij = np.rint(inside - origin).astype(np.int64)
+        lookup = np.zeros(shape, dtype=bool)
+        lookup[ij[:, 0], ij[:, 1]] = True
 
-        n = 0
+        self.lookup = lookup
+        self.lookup_origin = origin
+
+        return lookup
+    
+    
+    def evaluate_points(self, start_points:set={(0.,0.)}, max_iter:int=1000, print_iter:int=None):
+        """
+        Finds the inside and boundary points according to the constraint function.
+        The exploration is a flood fill of the lattice of the start points with
+        the moves of the kernel, it raises an error when more than max_iter
+        inside points are found.
+        """
+
+        starts = np.array(list(start_points), dtype=float).reshape(-1, 2)
+        inside = []
+        boundary = []
+        tables = []
+        num_inside = 0
         if print_iter!=None:
-            print(f'n° iter (of {max_iter}):', end = '\t')
-
-        while len(points_to_explore)!=0 and n<max_iter:
-            if print_iter!=None and n%10 == 0:
-                print(n, end='\t')            
-            
-            n+=1
-            # select a point to explore and analyze its neighbours
-            point = points_to_explore.pop()
-            neighbors = find_neighbors(*point)
-            new_inside = {neighbor for neighbor in neighbors \
-                if ((neighbor not in inside_points) and self.function(*neighbor))}
-            new_bondary = {neighbor for neighbor in (neighbors-new_inside) \
-                if  not self.function(*neighbor)}
-            # add the good neighbours in the inside_points and points_to_explore
-            inside_points = inside_points.union(new_inside)
-            points_to_explore = points_to_explore.union(new_inside)
-            bondary_points = bondary_points.union(new_bondary)
-        
-        self.inside_points = inside_points
-        self.boundary_points = bondary_points
+            print(f'n° points (of {max_iter}):', end = '\t')
 
-        if len(points_to_explore)>0:
-            raise 'The boundaries are too large. Increase the max_iter variable to explore more points.'
+        # points whose offsets are not integer lie on different lattices
+        while len(starts)>0:
+            origin = starts[0]
+            offsets = starts - origin
+            on_lattice = (offsets==np.rint(offsets)).all(axis=1)
+            state, low, n = flood_fill(
+                evaluate = self.evaluate,
+                origin = origin,
+                start = np.rint(offsets[on_lattice]).astype(np.int64),
+                max_points = max_iter - num_inside,
+                print_iter = print_iter,
+                moves = self.kernel.offsets
+                )
+            num_inside += n
+            inside.append(origin + low + np.argwhere(state==INSIDE))
+            boundary.append(origin + low + np.argwhere(state==BOUNDARY))
+            tables.append((state, origin + low))
+            starts = starts[~on_lattice]
+        inside = np.concatenate(inside)
+        boundary = np.concatenate(boundary)
+
+        self.inside_points = set(zip(inside[:, 0].tolist(), inside[:, 1].tolist()))
+        self.boundary_points = set(zip(boundary[:, 0].tolist(), boundary[:, 1].tolist()))
+        self.closest_boundary = None
+        self.distance_map = None
+        self.lookup = None
+        if len(tables)==1:
+            # the table of the flood fill already is a lookup table
+            state, low = tables[0]
+            occupied = np.argwhere(state)
+            first = occupied.min(axis=0)
+            last = occupied.max(axis=0) + 1
+            self.lookup = state[first[0]:last[0], first[1]:last[1]]==INSIDE
+            self.lookup_origin = low + first
+
+        if num_inside>max_iter:
+            raise RuntimeError('Error: The boundaries are too large. Increase the max_iter variable to explore more points.')
         
         print(f'\nNumber of points inside the boundaries: {len(self.inside_points)}\n')
 
-        return inside_points, bondary_points
+        return self.inside_points, self.boundary_points
     
     def find_closest_boundary(self):
         """
-        Finds the closest boundary point and its distance per each inside point
+        Finds the closest boundary point and its distance per each inside point.
+        The distance is the exact number of unit steps (L1 distance) calculated 
+        with a distance transform of the lookup table.
         """
 
-        if self.inside_points==None or self.boundary_points==None:
-            raise "No inside_points of boundary_points detected"
-    
-        closest_boundary = dict()
-        for ip in self.inside_points:
-            distances = {bp: points_distance(ip, bp) for bp in self.boundary_points}
-            best = min(distances, key=distances.get)
-            closest_boundary[ip] = (best, distances[best])
+        if self.inside_points is None or self.boundary_points is None:
+            raise ValueError("No inside_points or boundary_points detected")
+        if self.lookup is None:
+            self.build_lookup()
+
+        boundary = np.array(list(self.boundary_points), dtype=float).reshape(-1, 2)
+        ij = np.rint(boundary - self.lookup_origin).astype(np.int64)
+        sources = np.zeros(self.lookup.shape, dtype=bool)
+        sources[ij[:, 0], ij[:, 1]] = True
+        distance_map, closest = distance_transform(sources)
+        # the maps are only meaningful on the inside points
+        distance_map[~self.lookup] = -1
+
+        closest_boundary = ClosestBoundary(
+            inside_points = self.inside_points,
+            distance_map = distance_map,
+            closest = closest,
+            origin = self.lookup_origin
+            )
         
+        self.distance_map = distance_map
         self.closest_boundary = closest_boundary
         
         return closest_boundary
+
+
+    def to_arrays(self):
+        """
+        Returns the points and the tables of the constraints as arrays
+        """
+        if self.inside_points is None or self.boundary_points is None:
+            raise ValueError("No inside_points or boundary_points detected")
+        if self.lookup is None:
+            self.build_lookup()
+
+        arrays = {
+            'inside_points': np.array(list(self.inside_points), dtype=float).reshape(-1, 2),
+            'boundary_points': np.array(list(self.boundary_points), dtype=float).reshape(-1, 2),
+            'lookup': self.lookup,
+            'lookup_origin': self.lookup_origin,
+            }
+        if self.closest_boundary is not None:
+            arrays['distance_map'] = self.distance_map
+            arrays['closest'] = self.closest_boundary.closest
+
+        return arrays
     
-   
\ No newline at end of file
+    def from_arrays(self, arrays:dict):
+        """
+        Restores the points and the tables of the constraints from arrays
+        """
+        inside = arrays['inside_points']
+        boundary = arrays['boundary_points']
+        self.inside_points = set(zip(inside[:, 0].tolist(), inside[:, 1].tolist()))
+        self.boundary_points = set(zip(boundary[:, 0].tolist(), boundary[:, 1].tolist()))
+        self.lookup = arrays['lookup']
+        self.lookup_origin = arrays['lookup_origin']
+        self.distance_map = None
+        self.closest_boundary = None
+        if 'distance_map' in arrays:
+            self.distance_map = arrays['distance_map']
+            self.closest_boundary = ClosestBoundary(
+                inside_points = self.inside_points,
+                distance_map = self.distance_map,
+                closest = arrays['closest'],
+                origin = self.lookup_origin
+                )
+
+        return self
@@ -0,0 +1,218 @@
+import numpy as np
+
+
+# running sums of the estimator, one row per time step
+SUMS_DTYPE = np.dtype([
+    ('y', np.float64),
+    ('m', np.float64),
+    ('yy', np.float64),
+    ('mm', np.float64),
+    ('ym', np.float64),
+    ])
+
+
+class ControlVariate():
+    """
+    A class used to represent a variance reduced estimator of the average
+    time to reach the food, updated at each step of a simulation of Ants.
+
+    The target of each ant is its time to reach the food, truncated at the
+    current step s plus the expected time left from its current position
+    (tail), Y = min(T, s) + tail(X_s). Since the tail is the exact expected
+    time, the average of Y is an unbiased estimate of mu at every step, also
+    for the truncated simulations.
+    The control variate is the martingale of the distance of the ants from
+    the boundary, M = h(X_s) - h(x0) - sum_k Lh(X_k), where Lh is the expected
+    change of the distance in one move. Its mean is zero and it is strongly
+    correlated with Y, so mu is estimated as mean(Y) - beta*mean(M) with the
+    regression coefficient beta.
+    ...
+
+    Attributes
+    ----------
+    tail_field : solver.TimeField
+        expected time to reach the food from each inside point
+    num_initial : int
+        initial number of ants
+    h : np.array
+        distance of each point of the lookup table of the constraints from its
+        closest boundary point, 0 outside of the inside points
+    drift : np.array
+        expected change of h in one move from each inside point (Lh)
+    tail : np.array
+        expected time to reach the food from each point of the lookup table,
+        0 outside of the inside points (no tail correction if not given)
+    shift : np.array
+        offset from the lattice positions of the ants to the lookup table
+    h0 : float
+        distance of the initial position from the boundary
+    accumulated : np.array
+        sum of the drift along the path of each alive ant, aligned with the positions
+    dead : np.array
+        running sums of Y, M and of their products over the dead ants
+    sums : np.array
+        structured array with the running sums over all the ants per each step
+
+
+    Methods
+    -------
+    initialize(ants, constraints)
+        Builds the tables for the ants and the constraints
+    before_move(positions)
+        Accumulates the drift of the positions of the alive ants
+    after_move(step, positions, is_alive)
+        Stores the dead ants and the sums of the current step
+    estimate(step:int=None)
+        Returns the estimate of mu and its standard error at a step
+    to_arrays()
+        Returns the state of the estimator as arrays
+    from_arrays(arrays:dict)
+        Restores the state of the estimator from arrays
+    """
+
+
+    def __init__(self, tail=None) -> None:
+        self.tail_field = tail
+        self.h = None
+        self.drift = None
+        self.tail = None
+        self.shift = None
+        self.h0 = None
+        self.accumulated = None
+        self.dead = np.zeros((), dtype=SUMS_DTYPE)
+        self.sums = np.zeros(64, dtype=SUMS_DTYPE)
+        self.num_initial = None
+
+
+    def initialize(self, ants, constraints):
+        """
+        Builds the tables of the distance, of its drift and of the tail on the
+        lookup table of the constraints, for the ants starting from their origin
+        """
+        if constraints.distance_map is None:
+            constraints.find_closest_boundary()
+        inside = constraints.lookup
+        self.h = np.where(inside, constraints.distance_map, 0).astype(float)
+        # expected distance after one move, every move lands inside the table
+        expected = np.zeros_like(self.h)
+        height, width = self.h.shape
+        kernel = constraints.kernel
+        for (dx, dy), p in zip(kernel.offsets, kernel.probabilities):
+            expected[max(-dx,0):height+min(-dx,0), max(-dy,0):width+min(-dy,0)] += \
+                p*self.h[max(dx,0):height+min(dx,0), max(dy,0):width+min(dy,0)]
+        self.drift = np.where(inside, expected - self.h, 0)
+        self.tail = np.zeros_like(self.h)
+        if self.tail_field is not None:
+            x, y = np.indices(self.h.shape)
+            times = self.tail_field.lookup(
+                constraints.lookup_origin[0] + x,
+                constraints.lookup_origin[1] + y
+                )
+            self.tail = np.where(inside, np.nan_to_num(times), 0)
+        self.shift = constraints.lattice_shift(ants.origin)
+        if self.shift is None:
+            raise ValueError("The initial position is not on the lattice of the inside points")
+        self.h0 = self.h[tuple(self.shift)]
+        self.num_initial = ants.num_initial
+        self.accumulated = np.zeros(ants.num_initial)
+        self.store(0, np.zeros((ants.num_initial, 2), dtype=np.int64))
+
+        return self
+
+
+    def before_move(self, positions):
+        """
+        Accumulates the drift of the positions of the alive ants before a move
+        """
+        i = positions[:, 0] + self.shift[0]
+        j = positions[:, 1] + self.shift[1]
+        self.accumulated[:len(positions)] += self.drift[i, j]
+
+
+    def after_move(self, step:int, positions, is_alive):
+        """
+        Stores the targets and the controls of the ants dead at step, keeps
+        the accumulated drift of the alive ants aligned with the alive
+        positions and stores the sums of the step
+        """
+        accumulated = self.accumulated[:len(is_alive)]
+        # the ants reach the boundary, where h and the tail are 0
+        y = float(step)
+        m = -self.h0 - accumulated[~is_alive]
+        self.dead['y'] += y*len(m)
+        self.dead['m'] += m.sum()
+        self.dead['yy'] += y*y*len(m)
+        self.dead['mm'] += (m*m).sum()
+        self.dead['ym'] += y*m.sum()
+        num_alive = int(is_alive.sum())
+        self.accumulated[:num_alive] = accumulated[is_alive]
+        self.store(step, positions[is_alive])
+
+
+    def store(self, step:int, positions):
+        """
+        Stores the sums over the dead ants and the alive ants at step
+        """
+        if step>=len(self.sums):
+            sums = np.zeros(2*len(self.sums), dtype=SUMS_DTYPE)
+            sums[:len(self.sums)] = self.sums
+            self.sums = sums
+        i = positions[:, 0] + self.shift[0]
+        j = positions[:, 1] + self.shift[1]
+        y = step + self.tail[i, j]
+        m = self.h[i, j] - self.h0 - self.accumulated[:len(positions)]
+        for name, values in [('y', y), ('m', m), ('yy', y*y), ('mm', m*m), ('ym', y*m)]:
+            self.sums[step][name] = self.dead[name] + values.sum()
+
+
+    def estimate(self, step:int):
+        """
+        Returns the estimate of mu and its standard error at step
+        """
+        n = self.num_initial
+        s = self.sums[step]
+        y = s['y']/n
+        m = s['m']/n
+        syy = s['yy'] - n*y*y
+        smm = s['mm'] - n*m*m
+        sym = s['ym'] - n*y*m
+        beta = sym/smm if smm>0 else 0.
+        mu = y - beta*m
+        if n<=2:
+            return mu, np.nan
+        residual = max(syy - 2*beta*sym + beta*beta*smm, 0.)/(n-2)
+        return mu, np.sqrt(residual/n)
+
+
+    def to_arrays(self):
+        """
+        Returns the state of the estimator as arrays
+        """
+        return {
+            'h': self.h,
+            'drift': self.drift,
+            'tail': self.tail,
+            'shift': self.shift,
+            'h0': np.array(self.h0),
+            'num_initial': np.array(self.num_initial),
+            'accumulated': self.accumulated,
+            'dead': self.dead,
+            'sums': self.sums,
+            }
+
+
+    def from_arrays(self, arrays:dict):
+        """
+        Restores the state of the estimator from arrays
+        """
+        self.h = arrays['h']
+        self.drift = arrays['drift']
+        self.tail = arrays['tail']
+        self.shift = arrays['shift']
+        self.h0 = arrays['h0'][()]
+        self.num_initial = int(arrays['num_initial'])
+        self.accumulated = arrays['accumulated'].copy()
+        self.dead = arrays['dead'].copy()
+        self.sums = arrays['sums'].copy()
+
+        return self
@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 import seaborn as sns
+import matplotlib.pyplot as plt
 
 
 class Grid():
@@ -23,24 +24,36 @@ class Grid():
         default value used to initialize the grids values
     default_grid : pd.DataFrame
         starting grid before placing the ants
+    values : np.array
+        values of the grid, shared with the grid dataframe
     grid : pd.DataFrame
         update grid with the ants
     mask : pd.DataFrame
         dataframe that represents the constraints with True values on the grid
     font_plots : dict
         parameters regarding the font of the plot to display
+    artists : dict
+        persistent artists of the last draw, updated by redraw
 
 
     Methods
     -------
     initialize_grid()
         Initializes the default grid
-    update_grid(constraints)
+    update_grid(changes, from_default=True)
         Updates the positions of the ants on the grid
+    update_positions(coords, counts, from_default=True)
+        Updates the grid with arrays of coordinates and numbers of ants
     initialize_mask(max_steps:int=None, ax=None, **plt_kwargs)
         Initialize the mask regarding the problem constraints
     plot(max_steps:int=None, ax=None, **plt_kwargs)
         Plots a graph with the current ants positions on the grid
+    draw(vmax=None, ax=None, annot=True, fmt='.2g')
+        Draws the mask once and creates the artists updated by redraw
+    redraw(text=None)
+        Updates the artists of draw with the current grid values
+    plot_field(field, ax=None, show_cbar:bool=True)
+        Plots the expected time to reach the food from each point of the grid
     """
     
 
@@ -56,7 +69,8 @@ class Grid():
         
         self.default_grid = None
         self.initialize_grid()
-        self.grid = self.default_grid
+        self.values = self.default_grid.to_numpy(copy=True)
+        self.grid = pd.DataFrame(data=self.values, index=self.index, columns=self.columns, copy=False)
         #self.update_grid(changes)
         self.mask = None
         self.mask = self.initialize_mask(constraints)
@@ -67,6 +81,7 @@ class Grid():
             'weight': 'normal',
             'size': 16,
             }
+        self.artists = None
 
 
     def initialize_grid(self):
@@ -77,35 +92,43 @@ class Grid():
     
 
     def update_grid(self, changes, from_default=True):
-        #if changes!=None:
         # if from_default=True it starts the changes form the default grid, otherise fromt the actual one
-        if from_default:
-            self.grid = self.default_grid.copy()
-        # update the grid
         if changes.size>=1:
-            
-            for x,y in changes.index:
-                # the grid could be smaller than the indeces in 'changes'
-                if x in set(self.columns) and y in set(self.index):
-                    self.grid.at[y,x] = changes[x,y]
+            coords = np.stack([
+                changes.index.get_level_values(0).to_numpy(dtype=float),
+                changes.index.get_level_values(1).to_numpy(dtype=float)
+                ], axis=1)
+        else:
+            coords = np.empty((0, 2))
+        return self.update_positions(coords, changes.to_numpy(), from_default=from_default)
+
+
+    def update_positions(self, coords, counts, from_default=True):
+        """
+        Updates the grid with the numbers of ants counts on the points coords,
+        e.g. the output of Ants.occupied_positions()
+        """
+        if from_default:
+            self.values[:] = self.default_value
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        # row and column of each point, the grid could be smaller than the points
+        j = coords[:, 0] - self.columns[0]
+        i = self.index[0] - coords[:, 1]
+        inside = (j==np.rint(j)) & (i==np.rint(i)) & (j>=0) & (j<self.width) & (i>=0) & (i<self.height)
+        self.values[i[inside].astype(np.int64), j[inside].astype(np.int64)] = np.asarray(counts)[inside]
 
         return self.grid
 
     
     def initialize_mask(self, constraints):
         if constraints!=None:
-            # create every possible combination between 2 arrays
-            mask = pd.DataFrame(index = pd.MultiIndex.from_product([self.index, self.columns]))
-            mask.index.set_names(['y', 'x'], inplace=True)
-            # evaluate the constraint function in each point
-            mask['mask'] = mask.reset_index().apply(lambda pos: not constraints(pos['x'], pos['y']), axis=1).values
-            # tranform from 1D to 2D
-            mask = mask.unstack(level=1) # level=1 means that the indeces would be the y
-            # drop the name "mask" from the columns
-            mask = mask.droplevel(level=0, axis=1)
-            # unstack changes th order of the indexes, so we have to sorte them again
-            mask = mask.sort_index(ascending=False, axis=0)
-            mask = mask.sort_index(ascending=True, axis=1)
+            # evaluate the constraint function in each point of the grid
+            x, y = np.meshgrid(self.columns, self.index)
+            mask = pd.DataFrame(
+                data = ~constraints.evaluate(x, y),
+                index = pd.Index(self.index, name='y'),
+                columns = pd.Index(self.columns, name='x')
+                )
             # update the mask
             self.mask = mask
             return mask
@@ -143,4 +166,108 @@ class Grid():
         ax.set_title("Ants Positions", fontdict=self.font_plots)
         ax.text(self.width + self.width//4, self.height//2, text, fontsize=12)
 
-        return ax
\ No newline at end of file
+        return ax
+
+
+    def draw(self, vmax=None, ax=None, annot:bool=True, fmt:str='.2g'):
+        """
+        Draws the mask once and creates the persistent artists (image of the
+        grid values, annotations and text) that redraw updates at each step
+        """
+        if ax is None:
+            ax = plt.gca()
+        ax.clear()
+        extent = (-0.5, self.width-0.5, self.height-0.5, -0.5)
+        # static mask, drawn only once
+        if self.mask is not None:
+            ax.imshow(self.mask.to_numpy(dtype=float), vmin=0, vmax=10, cmap='Blues', extent=extent)
+        # nan values are transparent
+        image = ax.imshow(
+            self.values, 
+            vmin = 0, 
+            vmax = vmax, 
+            cmap = sns.color_palette('rocket_r', as_cmap=True), 
+            extent = extent
+            )
+        # white lines between the cells
+        separators = [
+            ax.vlines(np.arange(self.width+1)-0.5, -0.5, self.height-0.5, color='white', linewidth=0.5),
+            ax.hlines(np.arange(self.height+1)-0.5, -0.5, self.width-0.5, color='white', linewidth=0.5)
+            ]
+        ax.set_xticks(np.arange(self.width), labels=self.columns)
+        ax.set_yticks(np.arange(self.height), labels=self.index)
+        ax.set_xlim(-0.5, self.width-0.5)
+        ax.set_ylim(self.height-0.5, -0.5)
+        ax.set_title("Ants Positions", fontdict=self.font_plots)
+
+        labels = None
+        if annot:
+            i, j = np.indices(self.values.shape)
+            labels = [
+                ax.text(c, r, '', ha='center', va='center', fontsize=8) 
+                for r, c in zip(i.ravel(), j.ravel())
+                ]
+        text = ax.text(self.width + self.width//4 - 0.5, self.height//2 - 0.5, '', fontsize=12)
+
+        self.artists = {
+            'image': image, 'separators': separators, 'labels': labels, 
+            'text': text, 'fmt': fmt, 'vmax': vmax
+            }
+        self.redraw()
+
+        return ax
+
+
+    def redraw(self, text:str=None):
+        """
+        Updates the artists created by draw with the current grid values
+        and returns all of them in drawing order
+        """
+        if self.artists is None:
+            raise RuntimeError('Error: The grid must be drawn before redrawing it.')
+        image = self.artists['image']
+        image.set_data(self.values)
+        labels = self.artists['labels'] or []
+        if labels:
+            vmax = self.artists['vmax'] if self.artists['vmax'] is not None else np.nanmax(self.values, initial=0)
+            for label, value in zip(labels, self.values.ravel()):
+                if np.isnan(value):
+                    label.set_text('')
+                else:
+                    label.set_text(format(value, self.artists['fmt']))
+                    label.set_color('white' if value>vmax/2 else 'black')
+        if text is not None:
+            self.artists['text'].set_text(text)
+
+        return [image, *self.artists['separators'], *labels, self.artists['text']]
+
+
+    def plot_field(self, field, ax=None, show_cbar:bool=True):
+        """
+        Plots the expected time to reach the food from each point of the grid,
+        given a solver.TimeField
+        """
+        if ax is None:
+            ax = plt.gca()
+        x, y = np.meshgrid(self.columns, self.index)
+        data = pd.DataFrame(
+            data = field.lookup(x, y),
+            index = pd.Index(self.index, name='y'),
+            columns = pd.Index(self.columns, name='x')
+            )
+        sns.heatmap(
+            data = data, 
+            vmin = 0, 
+            cmap = 'rocket_r', 
+            annot = True,
+            fmt = '.1f',
+            linecolor='white',
+            linewidths = 0.5, 
+            xticklabels=True, 
+            yticklabels=True,
+            cbar = show_cbar,
+            ax = ax
+            )
+        ax.set_title("Expected time to reach the food", fontdict=self.font_plots)
+
+        return ax
@@ -0,0 +1,148 @@
+import numpy as np
+
+
+class Kernel():
+    """
+    A class used to represent the moves of the ants at each time step: the
+    lattice offsets of the moves and their probabilities.
+    The moves are sampled in constant time per ant with an alias table.
+    ...
+
+    Attributes
+    ----------
+    offsets : np.array
+        integer lattice offsets of the moves, one row per move
+    probabilities : np.array
+        probability of each move
+    uniform : bool
+        True if all the moves have the same probability
+    symmetric : bool
+        True if each move has the same probability of the opposite move
+    reach : int
+        largest number of unit steps (L1 norm) covered by a move
+    alias_probability : np.array
+        probability to keep each column of the alias table
+    alias : np.array
+        move taken with the remaining probability of each column
+
+
+    Methods
+    -------
+    sample(rng, n)
+        Returns the indices of n random moves
+    build_alias_table()
+        Builds the alias table of the probabilities (Vose's method)
+    """
+
+
+    def __init__(self, offsets, weights=None) -> None:
+        offsets = np.asarray(offsets)
+        if offsets.ndim!=2 or offsets.shape[1]!=2 or len(offsets)==0:
+            raise ValueError("Error: 'offsets' must be a list of (dx, dy) moves")
+        if not np.array_equal(offsets, np.rint(offsets)):
+            raise ValueError("Error: 'offsets' must be integer")
+        if len(np.unique(offsets, axis=0))<len(offsets):
+            raise ValueError("Error: 'offsets' must not contain duplicated moves")
+        weights = np.ones(len(offsets)) if weights is None else np.asarray(weights, dtype=float)
+        if weights.shape!=(len(offsets),) or (weights<0).any() or weights.sum()<=0:
+            raise ValueError("Error: 'weights' must be one non-negative weight per move")
+        # the moves that never happen are dropped
+        keep = weights>0
+        self.offsets = offsets[keep].astype(np.int32)
+        self.probabilities = weights[keep]/weights[keep].sum()
+        self.uniform = bool((weights[keep]==weights[keep][0]).all())
+        self.symmetric = all(
+            self.probability(-offset)==p for offset, p in zip(self.offsets, self.probabilities)
+            )
+        self.reach = int(np.abs(self.offsets).sum(axis=1).max())
+        self.alias_probability = None
+        self.alias = None
+        self.build_alias_table()
+
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+    def __repr__(self):
+        return f'Kernel(offsets={self.offsets.tolist()}, weights={self.probabilities.tolist()})'
+
+
+    def probability(self, offset):
+        """
+        Returns the probability of the move with the given offset
+        """
+        found = (self.offsets==np.asarray(offset)).all(axis=1)
+        return self.probabilities[found].sum()
+
+
+    def build_alias_table(self):
+        """
+        Builds the alias table of the probabilities (Vose's method): column k
+        keeps move k with probability alias_probability[k], otherwise it
+        takes move alias[k]
+        """
+        n = len(self.probabilities)
+        scaled = self.probabilities*n
+        alias_probability = np.ones(n)
+        alias = np.arange(n)
+        small = [k for k in range(n) if scaled[k]<1]
+        large = [k for k in range(n) if scaled[k]>=1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            alias_probability[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1
+            (small if scaled[l]<1 else large).append(l)
+        # the leftovers are 1 up to rounding errors
+        self.alias_probability = alias_probability
+        self.alias = alias
+
+        return alias_probability, alias
+
+
+    def sample(self, rng, n:int):
+        """
+        Returns the indices of n random moves, drawn with rng
+        (a np.random.Generator or the np.random module)
+        """
+        column = rng.choice(len(self), n)
+        if self.uniform:
+            return column
+        keep = rng.random(n) < self.alias_probability[column]
+        return np.where(keep, column, self.alias[column])
+
+
+def simple():
+    """
+    One unit step up, down, left or right with the same probability
+    """
+    return Kernel([[1,0], [-1,0], [0,1], [0,-1]])
+
+
+def lazy(stay:float=0.5):
+    """
+    Stays on the same point with probability stay, otherwise makes a simple step
+    """
+    if not 0<=stay<1:
+        raise ValueError("Error: 'stay' must be in [0, 1)")
+    return Kernel([[0,0], [1,0], [-1,0], [0,1], [0,-1]], [stay] + [(1-stay)/4]*4)
+
+
+def diagonal():
+    """
+    One step to any of the 8 neighbours with the same probability
+    """
+    offsets = [[dx, dy] for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy)!=(0, 0)]
+    return Kernel(offsets)
+
+
+def biased(right:float=1, left:float=1, up:float=1, down:float=1):
+    """
+    One unit step with probabilities proportional to the weight of its direction
+    """
+    return Kernel([[1,0], [-1,0], [0,1], [0,-1]], [right, left, up, down])
+
+
+SIMPLE = simple()
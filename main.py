@@ -1,45 +1,27 @@
+import os
+import argparse
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 import boundary_func
-from utils import neighbors, dict2keys_values, read_yaml
-from ants import Ants
+import kernels
+from utils import dict2keys_values, read_yaml, apply_overrides
+from ants import Ants, AntsCounts, AntsDistribution
 from  constraints import Constraint
-from grid import Grid
+from solver import calculate_exact_solution, solve_expected_times, time_field
+from cache import Cache, function_hash
+from parallel import run_parallel
+from adaptive import run_adaptive
+from walkers import run_walkers
+from estimators import ControlVariate
+from checkpoint import save_checkpoint, load_checkpoint
+from profiler import profiler
+# matplotlib, seaborn (grid), pandas (history) and pyarrow (writer) are 
+# imported only by the functions that need them, so the runs without plots 
+# start faster
 
 
 CONFIG_PATH = 'config.yaml'
 
 
-def calculate_exact_solution(constraints, starting_point:tuple=(0.,0.)):
-    """
-    Calculates the exact average time to reach the food starting from starting_point
-    """
-    assert len(starting_point)==2
-    # create transition matrix
-    M = pd.DataFrame(
-        data = 0., 
-        index = list(constraints.inside_points), 
-        columns = list(constraints.inside_points)
-        )
-    for x,y in constraints.inside_points:
-        ngbr = neighbors(x, y)
-        ngbr = {n for n in ngbr if n in constraints.inside_points}
-        for n in ngbr:
-            M.at[(x, y), n] = 0.25
-    # calculate the inverse of (1-M)
-    inverse = np.linalg.inv(np.identity(len(constraints.inside_points))-M)
-    inverse = pd.DataFrame(
-        data = inverse, 
-        index = list(constraints.inside_points), 
-        columns = list(constraints.inside_points)
-        )
-    # calculate solution for a specific starting point
-    solution = inverse.sum()[starting_point]
-    return solution
-
-
 def base_track():
     """
     Tracks the random movements of the ants.
@@ -51,15 +33,135 @@ def base_track():
     text = text.format(*info.keys())
     print(text)
 
-    while ants.step<=cfg['tracking']['MAX_STEPS']-1 and ants.alive[ants.step]>0:
+    while ants.step<=cfg['tracking']['MAX_STEPS']-1 and ants.any_alive():
         
         ants.move(constraints)
+        if writer:
+            with profiler.phase('track.write'):
+                writer.write(ants)
+        if cfg['tracking']['CHECKPOINT_PATH'] and ants.step%cfg['tracking']['CHECKPOINT_INTERVAL']==0:
+            with profiler.phase('track.checkpoint'):
+                checkpoint()
         #grid.update_grid(changes=ants.position_summary)
 
         if ants.step%cfg['tracking']['BASE_TRACK_INTERVAL']==0 or \
             ants.step==cfg['tracking']['MAX_STEPS'] or \
-            ants.alive_perc==0:
-            info = ants.get_info()
+            not ants.any_alive():
+            with profiler.phase('track.print'):
+                info = ants.get_info()
+                text = '\t'.join(['{}']*len(info))
+                text = text.format(*info.values())
+                print(text)
+
+    if cfg['tracking']['CHECKPOINT_PATH']:
+        with profiler.phase('track.checkpoint'):
+            checkpoint()
+
+    return 
+
+
+def checkpoint():
+    """
+    Flushes the history and saves the state of the simulation, so it can be 
+    resumed from the current step
+    """
+    if writer:
+        writer.flush()
+    return save_checkpoint(cfg['tracking']['CHECKPOINT_PATH'], ants, constraints)
+
+
+def parallel_track():
+    """
+    Tracks the random movements of the ants splitting them across NUM_WORKERS processes.
+    The metrics calculations are displayed every TRACK_INTERVAL steps at the end of the simulation
+    """
+    global ants
+    ants = run_parallel(
+        constraints = constraints, 
+        n = cfg['ants']['NUM_ANTS'], 
+        initial_position = cfg['ants']['INITIAL_POSITION'], 
+        max_steps = cfg['tracking']['MAX_STEPS'], 
+        seed = cfg['ants']['SEED'], 
+        num_workers = cfg['ants']['NUM_WORKERS']
+        )
+
+    print_history()
+
+    return 
+
+
+def adaptive_track():
+    """
+    Tracks the random movements of waves of ants until the standard error of 
+    mu and the distance between the bounds are below the tolerances. 
+    The metrics calculations are displayed every TRACK_INTERVAL steps at the end of the simulation
+    """
+    global ants
+    ants, report = run_adaptive(
+        constraints = constraints, 
+        initial_position = cfg['ants']['INITIAL_POSITION'], 
+        tol = cfg['adaptive']['TOLERANCE'], 
+        width = cfg['adaptive']['WIDTH'], 
+        wave_size = cfg['adaptive']['WAVE_SIZE'], 
+        max_ants = cfg['adaptive']['MAX_ANTS'], 
+        horizon = cfg['tracking']['MAX_STEPS'], 
+        step_increment = cfg['adaptive']['STEP_INCREMENT'], 
+        max_steps = cfg['adaptive']['MAX_STEPS'], 
+        seed = cfg['ants']['SEED']
+        )
+    print_history()
+
+    text = '\t'.join(['{}:\t{}']*len(report))
+    text = text.format(*dict2keys_values(report))
+    print(f'\n{text}\n')
+
+    return report
+
+
+def walkers_track():
+    """
+    Moves independent walkers until they reach the food, leave the table 
+    around the initial position or reach MAX_STEPS, then prints the report 
+    and saves the histogram of the hitting times to PATH
+    """
+    (edges, counts), report = run_walkers(
+        constraints = constraints, 
+        initial_position = cfg['ants']['INITIAL_POSITION'], 
+        num_walkers = cfg['walkers']['NUM_WALKERS'], 
+        max_steps = cfg['walkers']['MAX_STEPS'], 
+        radius = cfg['walkers']['RADIUS'], 
+        num_bins = cfg['walkers']['NUM_BINS'], 
+        chunk_size = cfg['walkers']['CHUNK_SIZE'], 
+        backend = cfg['walkers']['BACKEND'], 
+        num_threads = cfg['walkers']['NUM_THREADS'], 
+        seed = cfg['ants']['SEED']
+        )
+    import pandas as pd
+    histogram = pd.DataFrame({'from': edges[:-1], 'to': edges[1:] - 1, 'hits': counts})
+    print(histogram[histogram['hits']>0].to_string(index=False))
+
+    text = '\t'.join(['{}:\t{}']*len(report))
+    text = text.format(*dict2keys_values(report))
+    print(f'\n{text}\n')
+    if cfg['walkers']['PATH']:
+        os.makedirs(os.path.dirname(cfg['walkers']['PATH']) or '.', exist_ok=True)
+        histogram.to_csv(cfg['walkers']['PATH'], index=False)
+
+    return histogram, report
+
+
+def print_history():
+    """
+    Prints the metrics of the simulated ants every TRACK_INTERVAL steps
+    """
+    info = ants.get_info(step=0)
+    text = '\t'.join(['{}']*len(info))
+    text = text.format(*info.keys())
+    print(text)
+
+    for step in range(1, ants.step+1):
+        if step%cfg['tracking']['BASE_TRACK_INTERVAL']==0 or step==ants.step:
+            info = ants.get_info(step=step)
             text = '\t'.join(['{}']*len(info))
             text = text.format(*info.values())
             print(text)
@@ -70,7 +172,15 @@ def base_track():
 def animated_track():
     """
     Tracks and plots the random movements of the ants.
+    The figure is shown in a window, or, if ANIMATION_PATH is set, written
+    to a .mp4 or .gif file or to a .png file per frame without any window.
     """
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    from render import render_frames, write_frames
+    path = cfg['tracking']['ANIMATION_PATH']
+    if path:
+        plt.switch_backend('Agg')
     # CREATE FIGURE
     gs_kw = dict(width_ratios=[2, 1], height_ratios=[1, 1])
     fig, axd = plt.subplot_mosaic(
@@ -79,12 +189,25 @@ def animated_track():
         constrained_layout=False
     )
     plt.subplots_adjust(wspace=1, hspace=0.2)
+    lines = animation_init(axd)
+    # HEADLESS RENDERING
+    if path:
+        frames = render_frames(
+            fig = fig,
+            animated = grid.redraw() + list(lines.values()),
+            update = lambda i: animation_frame(i, axd, lines),
+            num_frames = cfg['tracking']['MAX_STEPS']
+            )
+        write_frames(frames, path, fps=1000/cfg['tracking']['WAIT_TIME'])
+        plt.close(fig)
+        return 
     # ANIMATION
     animation = FuncAnimation(
         fig=fig, 
         func=animation_frame, 
-        frames=cfg['tracking']['MAX_STEPS']-1, 
-        fargs=[axd], 
+        frames=cfg['tracking']['MAX_STEPS'], 
+        init_func=lambda: [],
+        fargs=[axd, lines], 
         interval=cfg['tracking']['WAIT_TIME'],
         blit=False,  
         repeat=False
@@ -93,136 +216,295 @@ def animated_track():
 
     return 
 
-def animation_frame(i, axd):
+
+def animation_init(axd):
     """
-    Performs one step of the random movements of the ants, 
-    plots their posistions and calculates the metrics 
+    Draws the static parts of the plots once and returns the lines of the
+    history plots updated at each step
     """
+    max_steps = cfg['tracking']['MAX_STEPS']
+    grid.update_positions(*ants.occupied_positions())
+    grid.draw(vmax=ants.num_initial, ax=axd['left'])
+    grid.redraw(text=info_text(ants.get_info()))
+    lines = {}
+    for pos, title in [
+        ('upper right', 'Percentage of ants that reached the food'), 
+        ('lower right', 'Percentage of alive ants')
+        ]:
+        ax = axd[pos]
+        ax.clear()
+        lines[pos], = ax.plot([], [])
+        ax.set_title(title, fontdict=ants.font_plots)
+        ax.set_xlabel('Step', fontdict=ants.font_plots)
+        ax.set_ylabel('% Ants', fontdict=ants.font_plots)
+        ax.set_xlim(0, max_steps)
+        ax.set_ylim(0, 1.05)
+    update_history_lines(lines)
 
-    ants.move(constraints)
-    grid.update_grid(changes=ants.position_summary)
+    return lines
 
-    info = ants.get_info()
 
+def info_text(info:dict):
     text = '\n'.join(['{}:\t{}']*len(info))
     text = text.format(*dict2keys_values(info))
-    text = text.expandtabs()
-
-    # clear what we have plot before
-    # this function avoids that the overlapping of the lines using different colours
-    for pos in axd:
-        axd[pos].clear()
-
-    # CREATE PLOTS
-    # FuncAnimation recreates the heatmap's cbar multiple times,
-    # then we need to plot it only during the first cycle
-    global first_cycle
-    first_cycle = True
-    if first_cycle:
-        grid.plot(
-            vmax=ants.num_initial, 
-            masked=True, 
-            text=text, 
-            ax = axd['left'], 
-            show_cbar=False
-            )
-        first_cycle = False   # turn off first_cycle
-    else:
-        grid.plot(
-            vmax=ants.num_initial, 
-            masked=True, 
-            text=text, 
-            ax = axd['left'], 
-            show_cbar=False
-            )
-    ants.plot_death_history(
-        cfg['tracking']['MAX_STEPS'], 
-        ax = axd['upper right']
-        )
-    ants.plot_alive_history_plot(
-        cfg['tracking']['MAX_STEPS'], 
-        ax = axd['lower right']
-        )
+    return text.expandtabs()
+
+
+def update_history_lines(lines:dict):
+    steps = np.arange(ants.step+1)
+    lines['upper right'].set_data(steps, ants.dead[:ants.step+1]/ants.num_initial)
+    lines['lower right'].set_data(steps, ants.alive[:ants.step+1]/ants.num_initial)
+    return list(lines.values())
+
+
+def animation_frame(i, axd, lines):
+    """
+    Performs one step of the random movements of the ants, 
+    updates the plots of their posistions and calculates the metrics 
+    """
+    if ants.step>=cfg['tracking']['MAX_STEPS'] or not ants.any_alive():
+        return []
+
+    ants.move(constraints)
+    with profiler.phase('animation.grid'):
+        grid.update_positions(*ants.occupied_positions())
+
+    with profiler.phase('animation.draw'):
+        info = ants.get_info()
+        updated = grid.redraw(text=info_text(info))
+        updated += update_history_lines(lines)
 
     #if ants.step%1==0 or ants.step>max_steps or ants.num_alive<=0:
     text = '\t'.join(['{}:\t{}']*len(info))
     text = text.format(*dict2keys_values(info))
     print(text)
 
-    return ants, grid
+    return updated
 
 
-def setup():
+def setup(config_path:str=None, overrides:list=None):
     """
     Loads the configuaration parameters and setups all the core variables.
+    The parameters of the configuration file (CONFIG_PATH if not given) can
+    be changed with overrides ('SECTION.KEY=VALUE' strings).
     """
     # config
     global cfg
-    cfg = read_yaml(CONFIG_PATH)
+    cfg = apply_overrides(read_yaml(config_path or CONFIG_PATH), overrides)
+    # profiler
+    profiler.reset()
+    if cfg['profiling']['ENABLED']:
+        profiler.enable(trace=bool(cfg['profiling']['TRACE_PATH']))
+    else:
+        profiler.disable()
     # seed
     np.random.seed(cfg['ants']['SEED'])
-    # ants
+    # ants (the parallel and adaptive simulations create them later)
     global ants
-    ants = Ants(
-        n = cfg['ants']['NUM_ANTS'], 
-        initial_position = cfg['ants']['INITIAL_POSITION']
-        )
+    walkers = cfg['walkers']['USE_WALKERS'] and cfg['tracking']['DO_TRACKING']
+    if walkers and cfg['tracking']['SHOW_ANIMATION']:
+        raise ValueError("Error: the walkers cannot be animated")
+    if cfg['ants']['SIMULATION']=='agents':
+        if (cfg['ants']['NUM_WORKERS']>1 or cfg['adaptive']['USE_ADAPTIVE'] or walkers) and not cfg['tracking']['SHOW_ANIMATION']:
+            ants = None
+        else:
+            ants = Ants(
+                n = cfg['ants']['NUM_ANTS'], 
+                initial_position = cfg['ants']['INITIAL_POSITION'],
+                max_steps = cfg['tracking']['MAX_STEPS']
+                )
+    elif cfg['ants']['SIMULATION']=='exact':
+        ants = AntsDistribution(
+            n = cfg['ants']['NUM_ANTS'], 
+            initial_position = cfg['ants']['INITIAL_POSITION'],
+            max_steps = cfg['tracking']['MAX_STEPS']
+            )
+    else:
+        # 'counts' draws the moves of the ants on each point, 'expected' uses their expected fractions
+        ants = AntsCounts(
+            n = cfg['ants']['NUM_ANTS'], 
+            initial_position = cfg['ants']['INITIAL_POSITION'],
+            max_steps = cfg['tracking']['MAX_STEPS'],
+            stochastic = cfg['ants']['SIMULATION']=='counts'
+            )
+    # cache
+    global cache
+    if cfg['cache']['USE_CACHE']:
+        cache = Cache(cfg['cache']['PATH'], cfg['cache']['MAX_SIZE'])
+    else:
+        cache = None
     # contraints
-    global constraints
-    constraints = Constraint(
-        getattr(boundary_func, cfg['constraints']['FUNCTION'])
-        )
-    constraints.evaluate_points(
-        start_points = {cfg['ants']['INITIAL_POSITION']}, 
-        max_iter = cfg['solution']['MAX_POINTS'], 
-        print_iter = None
-        )
-    constraints.find_closest_boundary()
+    global constraints, domain_key
+    function = getattr(boundary_func, cfg['constraints']['FUNCTION'])
+    kernel = getattr(kernels, cfg['ants']['KERNEL'])(**(cfg['ants']['KERNEL_PARAMETERS'] or {}))
+    constraints = Constraint(function, mode = cfg['constraints']['MODE'], kernel = kernel)
+    domain_key = [
+        'domain',
+        function_hash(function),
+        repr(kernel),
+        cfg['ants']['INITIAL_POSITION'],
+        cfg['solution']['MAX_POINTS']
+        ]
+    # the walkers evaluate the boundaries around them, so they also run on
+    # unbounded domains that cannot be explored
+    explore = not walkers or cfg['solution']['FIND_EXACT']
+    with profiler.phase('setup.cache'):
+        arrays = cache.load(cache.key(*domain_key)) if cache and explore else None
+    if explore and arrays is None:
+        with profiler.phase('setup.evaluate_points'):
+            constraints.evaluate_points(
+                start_points = {cfg['ants']['INITIAL_POSITION']}, 
+                max_iter = cfg['solution']['MAX_POINTS'], 
+                print_iter = None
+                )
+        with profiler.phase('setup.closest_boundary'):
+            constraints.find_closest_boundary()
+        if cache:
+            with profiler.phase('setup.cache'):
+                cache.save(cache.key(*domain_key), **constraints.to_arrays())
+    elif explore:
+        with profiler.phase('setup.cache'):
+            constraints.from_arrays(arrays)
+    if constraints.inside_points is not None:
+        profiler.count('inside_points', len(constraints.inside_points))
+    # variance reduced estimator, the tail correction uses the expected times
+    if cfg['ants']['ESTIMATOR']=='control':
+        if ants is None or type(ants) is not Ants:
+            raise ValueError("Error: 'ESTIMATOR: control' needs the serial simulation of the agents")
+        tail = find_expected_times()
+        with profiler.phase('setup.estimator'):
+            ants.estimator = ControlVariate(tail=tail)
+            ants.estimator.initialize(ants, constraints)
+    # resume the simulation from the last checkpoint
+    global resumed
+    path = cfg['tracking']['CHECKPOINT_PATH']
+    resumed = bool(cfg['tracking']['RESUME'] and path and os.path.exists(path))
+    if resumed:
+        if ants is None or cfg['tracking']['SHOW_ANIMATION']:
+            raise ValueError("Error: only the serial simulation without animation can be resumed")
+        with profiler.phase('setup.resume'):
+            load_checkpoint(path, ants, constraints)
+        print(f'Resumed from step {ants.step}\n')
     # grid
     if cfg['tracking']['SHOW_ANIMATION']:
         global grid
-        grid = Grid(cfg['grid']['HEIGHT'], cfg['grid']['WIDTH'])
-        start_change = pd.Series(
-            data = [cfg['ants']['NUM_ANTS']], 
-            index=[cfg['ants']['INITIAL_POSITION']]
-            )
-        grid.update_grid(changes=start_change)
-        grid.initialize_mask(constraints=constraints)
+        from grid import Grid
+        with profiler.phase('setup.grid'):
+            grid = Grid(cfg['grid']['HEIGHT'], cfg['grid']['WIDTH'])
+            grid.initialize_mask(constraints=constraints)
 
     return cfg
 
 
 
-def main():
+def find_expected_times():
+    """
+    Calculates the expected time to reach the food from every inside point
+    as a TimeField, reusing the results stored in the cache for the same 
+    domain and method.
+    """
+    key = cache.key(*domain_key, 'expected_times', cfg['solution']['METHOD']) if cache else None
+    with profiler.phase('solve.cache'):
+        arrays = cache.load(key) if cache else None
+    if arrays is not None:
+        return time_field(constraints, np.stack([arrays['x'], arrays['y']], axis=1), arrays['times'])
+
+    coords, times = solve_expected_times(constraints, method=cfg['solution']['METHOD'])
+    if cache:
+        cache.save(key, x=coords[:, 0], y=coords[:, 1], times=times)
+    return time_field(constraints, coords, times)
+
+
+def parse_args(argv:list=None):
+    """
+    Returns the path of the configuration file and the overrides of its 
+    parameters given on the command line
+    """
+    parser = argparse.ArgumentParser(
+        description = 'Simulates the ants looking for the food and calculates the exact average time to reach it.'
+        )
+    parser.add_argument('-c', '--config', default=CONFIG_PATH, help='configuration file')
+    parser.add_argument(
+        '-s', '--set', dest='overrides', action='append', default=[], metavar='SECTION.KEY=VALUE', 
+        help='changes a parameter of the configuration file (the value is read as YAML), can be repeated'
+        )
+    parser.add_argument(
+        '--headless', action='store_true', 
+        help='no animation and no plots, matplotlib is never imported'
+        )
+    parser.add_argument(
+        '--compute-only', action='store_true', 
+        help='only calculates the exact solution, without tracking and plots (only NumPy, SciPy and YAML are imported)'
+        )
+    args = parser.parse_args(argv)
+
+    overrides = list(args.overrides)
+    if args.headless or args.compute_only:
+        overrides += ['tracking.SHOW_ANIMATION=False', 'solution.SHOW_FIELD=False']
+    if args.compute_only:
+        overrides += ['tracking.DO_TRACKING=False', 'solution.FIND_EXACT=True']
+
+    return args.config, overrides
+
+
+def main(config_path:str=None, overrides:list=None):
     
-    setup()
+    setup(config_path, overrides)
     
 
     if cfg['solution']['FIND_EXACT']:
+        times = find_expected_times()
         solution = calculate_exact_solution(
             constraints = constraints, 
-            starting_point = cfg['ants']['INITIAL_POSITION']
+            starting_point = cfg['ants']['INITIAL_POSITION'],
+            times = times
             )
         print(f'\nExact solution: {np.round(solution, 3)}\n')
+        if cfg['solution']['SHOW_FIELD']:
+            import matplotlib.pyplot as plt
+            from grid import Grid
+            field_grid = Grid(cfg['grid']['HEIGHT'], cfg['grid']['WIDTH'])
+            field_grid.plot_field(times, ax=plt.figure(figsize=(11, 11)).gca())
+            plt.show()
     else:
         solution = None
 
-    if cfg['tracking']['DO_TRACKING']:
+    if cfg['tracking']['DO_TRACKING'] and cfg['walkers']['USE_WALKERS']:
+        # independent walkers, only their hitting times are kept
+        walkers_track()
+        history = None
+    elif cfg['tracking']['DO_TRACKING']:
+        # the history is streamed to PATH while the ants move
+        global writer
+        from writer import HistoryWriter
+        writer = HistoryWriter(cfg['tracking']['PATH'], cfg['tracking']['CHUNK_SIZE'], resume=resumed) if cfg['tracking']['PATH'] else None
+        if writer and resumed:
+            writer.rewind(ants.step)
         if cfg['tracking']['SHOW_ANIMATION']:
             animated_track()
+        elif cfg['adaptive']['USE_ADAPTIVE'] and cfg['ants']['SIMULATION']=='agents':
+            adaptive_track()
+        elif cfg['ants']['NUM_WORKERS']>1 and cfg['ants']['SIMULATION']=='agents':
+            parallel_track()
         else:
             base_track()
         # create dataframe with historical data
         history = ants.get_history()
-        # save
-        if cfg['tracking']['PATH']:
-            history.to_csv(cfg['tracking']['PATH'])
+        # save the steps not written yet
+        if writer:
+            writer.write(ants)
+            writer.close()
     else:
         history = None
 
+    if profiler.enabled:
+        profiler.print_summary()
+        if cfg['profiling']['TRACE_PATH']:
+            profiler.write_trace(cfg['profiling']['TRACE_PATH'])
+
     return solution, history
 
 
 if __name__=="__main__":
     
-    main()
\ No newline at end of file
+    main(*parse_args())
\ No newline at end of file
@@ -0,0 +1,219 @@
+import numpy as np
+from profiler import profiler
+
+
+def apply_operator(t, mask, kernel):
+    """
+    Returns (I-M)t on the points of the mask, where M moves the values with
+    the kernel and t is 0 outside of the mask. With the simple kernel it is
+    minus a quarter of the 5-point Laplacian.
+    """
+    out = t.copy()
+    height, width = t.shape
+    for (dx, dy), p in zip(kernel.offsets, kernel.probabilities):
+        # out(x) -= p*t(x + offset)
+        out[max(-dx,0):height+min(-dx,0), max(-dy,0):width+min(-dy,0)] -= \
+            p*t[max(dx,0):height+min(dx,0), max(dy,0):width+min(dy,0)]
+    out[~mask] = 0
+    return out
+
+
+def prolong_axis(coarse, n:int, axis:int):
+    """
+    Returns the linear interpolation along axis of the coarse values on the
+    n fine points, the coarse point i being the fine point 2i
+    """
+    coarse = np.moveaxis(coarse, axis, 0)
+    padded = np.concatenate([coarse, np.zeros((1,) + coarse.shape[1:])])
+    fine = np.empty((n,) + coarse.shape[1:])
+    fine[0::2] = coarse
+    fine[1::2] = 0.5*(padded[:n//2] + padded[1:n//2+1])
+    return np.moveaxis(fine, 0, axis)
+
+
+def restrict_axis(fine, axis:int):
+    """
+    Returns the transpose of prolong_axis applied to the fine values
+    """
+    fine = np.moveaxis(fine, axis, 0)
+    n = len(fine)
+    coarse = fine[0::2].copy()
+    odd = 0.5*fine[1::2]
+    coarse[:n//2] += odd
+    coarse[1:n//2+1] += odd[:len(coarse)-1]
+    return np.moveaxis(coarse, 0, axis)
+
+
+class Multigrid():
+    """
+    A class used to represent a geometric multigrid solver of (I-M)t = b on
+    the points of a 2-D mask, where M moves the values with a symmetric
+    kernel. With the simple kernel and b = 1 it is the discrete Poisson
+    problem of the expected times, Δt = -4 inside and t = 0 on the boundary.
+    The operator is never built: it is applied with shifted slices of the
+    2-D arrays, so memory and time per iteration are linear in the size of
+    the table. Each coarser level keeps every other point of the previous
+    mask (the mask is injected) with the same stencil, the transfers are the
+    bilinear interpolation and its transpose, the smoother is the damped
+    Jacobi and the coarsest level is solved exactly with a sparse
+    factorization, which stays cheap when thin domains stop the coarsening
+    early. A symmetric V-cycle
+    preconditions the conjugate gradient, which corrects the errors of the
+    coarse masks along the irregular boundaries.
+    ...
+
+    Attributes
+    ----------
+    kernel : kernels.Kernel
+        symmetric moves of the operator
+    masks : list
+        boolean masks of the points of each level, from the finest
+    diagonal : float
+        diagonal of the operator (1 minus the probability to stay)
+    omega : float
+        damping of the Jacobi smoother
+    smoothing : int
+        number of Jacobi sweeps before and after the coarse correction
+    coarse_index : np.array
+        position of the points of the coarsest mask in coarse_factor
+    coarse_factor : scipy.sparse.linalg.SuperLU
+        sparse LU factorization of the operator on the coarsest level
+    iterations : int
+        number of conjugate gradient iterations of the last solve
+
+
+    Methods
+    -------
+    operator(t, level:int=0)
+        Returns (I-M)t on the mask of the level
+    smooth(x, b, level:int)
+        Returns x after the Jacobi sweeps on the level
+    coarse_matrix()
+        Returns the sparse matrix of the operator on the coarsest level
+    vcycle(b, level:int=0)
+        Returns the approximate solution of a V-cycle from the level
+    solve(b, tol:float=1e-12, maxiter:int=1000)
+        Returns the solution of (I-M)t = b on the finest mask
+    """
+
+
+    def __init__(self, mask, kernel, coarsest:int=256, omega:float=0.8, smoothing:int=2) -> None:
+        if not kernel.symmetric:
+            raise ValueError("Error: the multigrid solver needs a symmetric kernel")
+        self.kernel = kernel
+        self.omega = omega
+        self.smoothing = smoothing
+        stay = [p for offset, p in zip(kernel.offsets, kernel.probabilities) if not offset.any()]
+        self.diagonal = 1. - sum(stay)
+        # each level keeps every other point of the previous one
+        self.masks = [np.asarray(mask, dtype=bool)]
+        while self.masks[-1].sum()>coarsest and min(self.masks[-1].shape)>2:
+            coarse = self.masks[-1][0::2, 0::2]
+            if not coarse.any():
+                break
+            self.masks.append(coarse)
+        # the coarsest level is factorized, it can be large on thin domains
+        from scipy.sparse import linalg as splinalg
+        self.coarse_index = np.flatnonzero(self.masks[-1])
+        self.coarse_factor = splinalg.splu(self.coarse_matrix())
+        self.iterations = 0
+
+
+    def coarse_matrix(self):
+        """
+        Returns the sparse matrix of the operator on the points of the coarsest mask
+        """
+        from scipy import sparse
+        mask = self.masks[-1]
+        n = len(self.coarse_index)
+        position = np.full(mask.shape, -1)
+        position.ravel()[self.coarse_index] = np.arange(n)
+        ij = np.argwhere(mask)
+        rows = [np.arange(n)]
+        cols = [np.arange(n)]
+        values = [np.ones(n)]
+        for (dx, dy), p in zip(self.kernel.offsets, self.kernel.probabilities):
+            i = ij[:, 0] + dx
+            j = ij[:, 1] + dy
+            valid = (i>=0) & (i<mask.shape[0]) & (j>=0) & (j<mask.shape[1])
+            row = np.flatnonzero(valid)
+            col = position[i[valid], j[valid]]
+            rows.append(row[col>=0])
+            cols.append(col[col>=0])
+            values.append(np.full((col>=0).sum(), -p))
+        # the duplicated entries are summed
+        return sparse.csc_matrix(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), 
+            shape = (n, n)
+            )
+
+
+    def operator(self, t, level:int=0):
+        """
+        Returns (I-M)t on the mask of the level
+        """
+        return apply_operator(t, self.masks[level], self.kernel)
+
+
+    def smooth(self, x, b, level:int):
+        """
+        Returns x after the damped Jacobi sweeps of the level
+        """
+        mask = self.masks[level]
+        for _ in range(self.smoothing):
+            x = x + (self.omega/self.diagonal)*(b - self.operator(x, level))
+            x[~mask] = 0
+        return x
+
+
+    def vcycle(self, b, level:int=0):
+        """
+        Returns the approximate solution of (I-M)x = b of a V-cycle from the
+        level (b is 0 outside of the mask). The cycle is a symmetric positive
+        definite preconditioner.
+        """
+        mask = self.masks[level]
+        if level==len(self.masks)-1:
+            x = np.zeros(mask.shape)
+            x.ravel()[self.coarse_index] = self.coarse_factor.solve(b.ravel()[self.coarse_index])
+            return x
+        x = self.smooth(np.zeros(mask.shape), b, level)
+        # coarse correction of the residual
+        residual = b - self.operator(x, level)
+        coarse = restrict_axis(restrict_axis(residual, 0), 1)
+        coarse[~self.masks[level+1]] = 0
+        correction = self.vcycle(coarse, level+1)
+        correction = prolong_axis(prolong_axis(correction, mask.shape[0], 0), mask.shape[1], 1)
+        correction[~mask] = 0
+        x += correction
+        return self.smooth(x, b, level)
+
+
+    def solve(self, b, tol:float=1e-12, maxiter:int=1000):
+        """
+        Returns the solution of (I-M)t = b on the finest mask with the
+        conjugate gradient preconditioned by V-cycles, stopping when the
+        residual is below tol times the norm of b
+        """
+        mask = self.masks[0]
+        b = np.where(mask, b, 0.)
+        x = np.zeros(mask.shape)
+        r = b.copy()
+        z = self.vcycle(r)
+        p = z.copy()
+        rz = (r*z).sum()
+        threshold = tol*np.sqrt((b*b).sum())
+        self.iterations = 0
+        while np.sqrt((r*r).sum())>threshold:
+            if self.iterations>=maxiter:
+                raise RuntimeError(f'The multigrid solver did not converge in {maxiter} iterations')
+            q = self.operator(p)
+            alpha = rz/(p*q).sum()
+            x += alpha*p
+            r -= alpha*q
+            z = self.vcycle(r)
+            rz, previous = (r*z).sum(), rz
+            p = z + (rz/previous)*p
+            self.iterations += 1
+        profiler.count('multigrid_iterations', self.iterations)
+        return x
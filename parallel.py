@@ -0,0 +1,49 @@
+import os
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from ants import Ants
+
+
+def split_ants(n:int, num_workers:int):
+    """
+    Returns the number of ants simulated by each worker
+    """
+    num_workers = min(n, num_workers)
+    return [n//num_workers + (i < n%num_workers) for i in range(num_workers)]
+
+
+def simulate_shard(constraints, n:int, initial_position:tuple, seed, max_steps:int):
+    """
+    Simulates n ants with an independent random generator until they are all
+    dead or max_steps is reached
+    """
+    ants = Ants(n, initial_position, rng=np.random.default_rng(seed), max_steps=max_steps)
+    while ants.step<max_steps and ants.any_alive():
+        ants.move(constraints)
+    return ants
+
+
+def run_parallel(constraints, n:int, initial_position:tuple, max_steps:int, seed:int=None, num_workers:int=None):
+    """
+    Splits the n ants across a pool of processes, simulates each shard with a
+    random generator spawned from seed and merges the results.
+    The result is reproducible for a fixed seed and number of workers.
+    The boundary function of the constraints must be picklable.
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    sizes = split_ants(n, num_workers)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    with ProcessPoolExecutor(max_workers=len(sizes)) as pool:
+        shards = list(pool.map(
+            simulate_shard,
+            repeat(constraints),
+            sizes,
+            repeat(initial_position),
+            seeds,
+            repeat(max_steps)
+            ))
+
+    return Ants.merge(shards, constraints)
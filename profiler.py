@@ -0,0 +1,266 @@
+import os
+import json
+import time
+
+
+class NullPhase():
+    """
+    Phase returned when the profiler is disabled, it does nothing
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+def records(table):
+    """
+    Returns the rows of the table as dictionaries, with None for the missing values
+    """
+    return table.astype(object).where(table.notna(), None).to_dict(orient='records')
+
+
+class Phase():
+    """
+    Context manager timing one run of a phase of the profiler
+    """
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name:str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler():
+    """
+    A class used to represent a collection of named timers and counters
+    around the phases of a run.
+    The phases are timed with 'with profiler.phase(name):' blocks; the dotted
+    names group the phases, so the total of 'move' is the sum of 'move.sample',
+    'move.constraints', ... The counters can be bound to a phase to report
+    their rate per second (e.g. the ants moved per second of 'move').
+    When the profiler is disabled phase returns a shared empty context and
+    count returns immediately, so the instrumented code runs at full speed.
+    Only the current process is measured.
+    ...
+
+    Attributes
+    ----------
+    enabled : bool
+        True if the phases and the counters are recorded
+    tracing : bool
+        True if every run of the phases is also stored as a trace event
+    timers : dict
+        number of runs, total time and maximum time of each phase
+    counters : dict
+        value of each counter
+    rates : dict
+        phase of the counters reported per second
+    events : list
+        trace events (name, start, duration) of the runs of the phases
+    start : float
+        time of the last enable or reset
+
+
+    Methods
+    -------
+    enable(trace:bool=False)
+        Starts recording the phases and the counters
+    disable()
+        Stops recording
+    reset()
+        Deletes the recorded phases, counters and events
+    phase(name:str)
+        Returns a context manager timing a run of the phase
+    count(name:str, value=1, phase:str=None)
+        Adds value to the counter
+    total(name:str)
+        Returns the total time of a phase or of a group of phases
+    summary()
+        Returns the table of the phases and the table of the counters
+    print_summary()
+        Prints the tables of the phases and of the counters
+    write_trace(path:str)
+        Writes the events and the counters to a JSON trace file
+    """
+
+
+    def __init__(self, enabled:bool=False, trace:bool=False) -> None:
+        self.enabled = False
+        self.tracing = False
+        self.reset()
+        if enabled:
+            self.enable(trace)
+
+
+    def enable(self, trace:bool=False):
+        self.enabled = True
+        self.tracing = trace
+        self.start = time.perf_counter()
+
+
+    def disable(self):
+        self.enabled = False
+        self.tracing = False
+
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+        self.rates = {}
+        self.events = []
+        self.start = time.perf_counter()
+
+
+    def phase(self, name:str):
+        """
+        Returns a context manager timing a run of the phase
+        """
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+
+    def record(self, name:str, start:float, end:float):
+        """
+        Stores a run of the phase from start to end
+        """
+        duration = end - start
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, duration, duration]
+        else:
+            timer[0] += 1
+            timer[1] += duration
+            timer[2] = max(timer[2], duration)
+        if self.tracing:
+            self.events.append((name, start, duration))
+
+
+    def count(self, name:str, value=1, phase:str=None):
+        """
+        Adds value to the counter, which is reported per second of phase if given
+        """
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+        if phase is not None:
+            self.rates[name] = phase
+
+
+    def total(self, name:str):
+        """
+        Returns the total time of the phase, or the sum of the times of the
+        phases of the group if the phase is not timed itself
+        """
+        if name in self.timers:
+            return self.timers[name][1]
+        return sum(timer[1] for key, timer in self.timers.items() if key.startswith(name + '.'))
+
+
+    def summary(self):
+        """
+        Returns the table of the phases (groups before their phases, in order
+        of first run) and the table of the counters
+        """
+        import pandas as pd
+        elapsed = time.perf_counter() - self.start
+        names = []
+        for name in self.timers:
+            parts = name.split('.')
+            for i in range(1, len(parts)+1):
+                group = '.'.join(parts[:i])
+                if group not in names:
+                    names.append(group)
+        rows = []
+        for name in names:
+            calls, total, longest = self.timers.get(name, (None, self.total(name), None))
+            rows.append({
+                'phase': '  '*name.count('.') + name,
+                'calls': calls,
+                'total [s]': total,
+                'mean [ms]': 1000*total/calls if calls else None,
+                'max [ms]': 1000*longest if calls else None,
+                '% of run': 100*total/elapsed if elapsed>0 else None,
+                })
+        phases = pd.DataFrame(rows, columns=['phase', 'calls', 'total [s]', 'mean [ms]', 'max [ms]', '% of run'])
+        phases['calls'] = phases['calls'].astype('Int64')
+        rows = []
+        for name, value in self.counters.items():
+            phase = self.rates.get(name)
+            time_spent = self.total(phase) if phase else 0
+            rows.append({
+                'counter': name,
+                'value': value,
+                'per second': value/time_spent if time_spent>0 else None,
+                'phase': phase,
+                })
+        counters = pd.DataFrame(rows, columns=['counter', 'value', 'per second', 'phase'])
+        return phases, counters
+
+
+    def print_summary(self):
+        """
+        Prints the tables of the phases and of the counters
+        """
+        phases, counters = self.summary()
+        print(f'\nProfile ({time.perf_counter() - self.start:.3f} s)\n')
+        import pandas as pd
+        # the missing values are left blank
+        blank = lambda value: '' if pd.isna(value) else str(value)
+        for table, first, other in [(phases, 'phase', 'calls'), (counters, 'counter', 'phase')]:
+            if len(table)==0:
+                continue
+            width = table[first].str.len().max()
+            table = table.assign(**{other: table[other].map(blank)})
+            print(table.to_string(
+                index = False,
+                na_rep = '',
+                float_format = '{:.4g}'.format,
+                formatters = {first: lambda name: name.ljust(width)},
+                justify = 'left'
+                ))
+            print()
+
+
+    def write_trace(self, path:str):
+        """
+        Writes the runs of the phases and the counters to a JSON file in the
+        trace event format (it can be opened with chrome://tracing or Perfetto)
+        """
+        pid = os.getpid()
+        events = [
+            {'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': pid, 'tid': 0,
+             'ts': 1e6*(start - self.start), 'dur': 1e6*duration}
+            for name, start, duration in self.events
+            ]
+        phases, counters = self.summary()
+        trace = {
+            'traceEvents': events,
+            'counters': self.counters,
+            'summary': {
+                'phases': records(phases.assign(phase=phases['phase'].str.strip())),
+                'counters': records(counters),
+                },
+            }
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(trace, file)
+
+        return path
+
+
+# profiler of the current process, enabled from the configuration file
+profiler = Profiler()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+from matplotlib import rcParams
+from PIL import Image
+
+
+FORMATS = ('.mp4', '.gif', '.png')
+
+
+def render_frames(fig, animated:list, update, num_frames:int):
+    """
+    Yields the RGBA pixels of the figure before and after each of the
+    num_frames calls of update. The static parts of the figure are drawn
+    only once, then each frame restores them and redraws the animated
+    artists on top. The frames stop early if update returns no artists.
+    The figure must use a canvas with blitting support, e.g. Agg.
+    """
+    canvas = fig.canvas
+    for artist in animated:
+        artist.set_animated(True)
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+
+    for i in range(num_frames+1):
+        if i>0 and len(update(i-1))==0:
+            break
+        canvas.restore_region(background)
+        for artist in animated:
+            fig.draw_artist(artist)
+        yield np.asarray(canvas.buffer_rgba()).copy()
+
+
+def write_png(frames, path:str):
+    """
+    Writes each frame to a numbered png file, e.g. path_00000.png
+    """
+    root, ext = os.path.splitext(path)
+    for i, frame in enumerate(frames):
+        Image.fromarray(frame).save(f'{root}_{i:05d}{ext}')
+
+
+def write_gif(frames, path:str, fps:float):
+    """
+    Writes the frames to a gif file
+    """
+    images = [Image.fromarray(frame).convert('RGB').quantize() for frame in frames]
+    images[0].save(path, save_all=True, append_images=images[1:], duration=1000/fps, loop=0)
+
+
+def write_mp4(frames, path:str, fps:float):
+    """
+    Pipes the frames to ffmpeg to write a mp4 file
+    """
+    ffmpeg = shutil.which(rcParams['animation.ffmpeg_path'])
+    if ffmpeg is None:
+        raise RuntimeError('Error: ffmpeg is needed to write .mp4 animations.')
+    process = None
+    for frame in frames:
+        if process is None:
+            height, width, _ = frame.shape
+            process = subprocess.Popen([
+                ffmpeg, '-y', '-loglevel', 'error',
+                '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}', '-r', str(fps), '-i', 'pipe:',
+                # h264 needs even width and height
+                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-vcodec', 'libx264', '-pix_fmt', 'yuv420p',
+                path
+                ], stdin=subprocess.PIPE)
+        process.stdin.write(frame.tobytes())
+    if process is not None:
+        process.stdin.close()
+        if process.wait()!=0:
+            raise RuntimeError(f'Error: ffmpeg failed to write {path}.')
+
+
+def write_frames(frames, path:str, fps:float):
+    """
+    Writes the frames to path according to its extension: a .mp4 or .gif
+    animation, or a numbered .png file per frame
+    """
+    ext = os.path.splitext(path)[1]
+    if ext not in FORMATS:
+        raise ValueError(f"Error: the animation path must end with one of {FORMATS}")
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if ext=='.png':
+        write_png(frames, path)
+    elif ext=='.gif':
+        write_gif(frames, path, fps)
+    else:
+        write_mp4(frames, path, fps)
+    return path
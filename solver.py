@@ -0,0 +1,255 @@
+import numpy as np
+from utils import lattice_index
+from profiler import profiler
+
+
+METHODS = ('dense', 'direct', 'iterative', 'multigrid')
+
+
+def transition_matrix(constraints, points:list=None):
+    """
+    Returns the sparse transition matrix between the inside points with the
+    moves of the kernel of the constraints and the list of the inside points 
+    in the same order of the matrix rows. The order of the inside points can
+    be given with points.
+    """
+    from scipy import sparse
+    kernel = constraints.kernel
+    if points is None:
+        points = list(constraints.inside_points)
+    table, ij, _ = lattice_index(points, border=kernel.reach)
+    rows = []
+    cols = []
+    data = []
+    for move, p in zip(kernel.offsets, kernel.probabilities):
+        # position of the neighbour in points, -1 if it is not an inside point
+        ngbr = table[ij[:, 0] + move[0], ij[:, 1] + move[1]]
+        found = ngbr >= 0
+        rows.append(np.flatnonzero(found))
+        cols.append(ngbr[found])
+        data.append(np.full(found.sum(), p))
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    M = sparse.csr_matrix(
+        (np.concatenate(data), (rows, cols)),
+        shape=(len(points), len(points))
+        )
+    return M, points
+
+
+def dissection_order(ij, leaf:int=64):
+    """
+    Returns a nested dissection ordering of the lattice points with integer
+    coordinates ij. The points are split recursively by a lattice line across
+    the longest side of their bounding box and the separators are eliminated
+    last, which keeps the fill-in of the LU factorization low.
+    """
+    blocks = []
+    def dissect(idx):
+        if len(idx)<=leaf:
+            blocks.append(idx)
+            return
+        coords = ij[idx]
+        low = coords.min(axis=0)
+        high = coords.max(axis=0)
+        axis = int(np.argmax(high-low))
+        middle = (low[axis]+high[axis])//2
+        c = coords[:, axis]
+        dissect(idx[c<middle])
+        dissect(idx[c>middle])
+        blocks.append(idx[c==middle])
+    dissect(np.arange(len(ij)))
+    return np.concatenate(blocks)
+
+
+def dense_expected_times(constraints):
+    """
+    Returns the expected time to reach the boundary from every inside point
+    inverting the dense matrix (I-M). Used as reference for the sparse solvers.
+    """
+    import pandas as pd
+    # create transition matrix
+    M = pd.DataFrame(
+        data = 0.,
+        index = list(constraints.inside_points),
+        columns = list(constraints.inside_points)
+        )
+    kernel = constraints.kernel
+    for x,y in constraints.inside_points:
+        for (dx, dy), p in zip(kernel.offsets.tolist(), kernel.probabilities):
+            n = (x + dx, y + dy)
+            if n in constraints.inside_points:
+                M.at[(x, y), n] = p
+    # calculate the inverse of (1-M)
+    inverse = np.linalg.inv(np.identity(len(constraints.inside_points))-M)
+    inverse = pd.DataFrame(
+        data = inverse,
+        index = list(constraints.inside_points),
+        columns = list(constraints.inside_points)
+        )
+    # expected time of each starting point (row)
+    return inverse.sum(axis=1)
+
+
+def expected_times(constraints, method:str='direct', tol:float=1e-10):
+    """
+    Returns the expected time to reach the boundary from every inside point
+    solving (I-M)t = 1, as a Series indexed by the coordinates of the points.
+    The 'direct' method uses a sparse LU factorization of the matrix ordered
+    by nested dissection, the 'iterative' method uses the conjugate gradient
+    for symmetric kernels (I-M is symmetric positive definite) and BiCGSTAB
+    otherwise, 'multigrid' solves the lattice Poisson problem on the lookup
+    table without building the matrix (symmetric kernels only) and 'dense' 
+    inverts the full matrix.
+    """
+    if method=='dense':
+        return dense_expected_times(constraints)
+    import pandas as pd
+    coords, times = solve_expected_times(constraints, method=method, tol=tol)
+    index = pd.MultiIndex.from_arrays([coords[:, 0], coords[:, 1]])
+    return pd.Series(data=times, index=index)
+
+
+def solve_expected_times(constraints, method:str='direct', tol:float=1e-10):
+    """
+    Returns the coordinates of the inside points and their expected time to
+    reach the boundary as arrays (see expected_times)
+    """
+    if method not in METHODS:
+        raise ValueError(f"Error: 'method' must be one of {METHODS}")
+    if method=='dense':
+        times = dense_expected_times(constraints)
+        return np.array(times.index.tolist(), dtype=float).reshape(-1, 2), times.to_numpy()
+    if method=='multigrid':
+        from multigrid import Multigrid
+        if constraints.lookup is None:
+            constraints.build_lookup()
+        inside = constraints.lookup
+        with profiler.phase('solve.multigrid'):
+            times = Multigrid(inside, constraints.kernel).solve(inside.astype(float), tol=min(tol, 1e-12))
+        return constraints.lookup_origin + np.argwhere(inside), times[inside]
+
+    from scipy import sparse
+    from scipy.sparse import linalg as splinalg
+    with profiler.phase('solve.matrix'):
+        M, points = transition_matrix(constraints)
+        A = (sparse.identity(len(points), format='csr') - M).tocsr()
+    profiler.count('matrix_rows', A.shape[0])
+    profiler.count('matrix_nnz', A.nnz)
+    symmetric = constraints.kernel.symmetric
+    b = np.ones(len(points))
+    coords = np.array(points).reshape(-1, 2)
+    if method=='direct':
+        with profiler.phase('solve.factorize'):
+            _, ij, _ = lattice_index(coords)
+            order = dissection_order(ij)
+            lu = splinalg.splu(
+                A[order][:, order].tocsc(),
+                permc_spec = 'NATURAL',
+                diag_pivot_thresh = 0.,
+                options = dict(SymmetricMode=symmetric)
+                )
+        profiler.count('factor_nnz', lu.L.nnz + lu.U.nnz)
+        with profiler.phase('solve.substitution'):
+            times = np.empty(len(points))
+            times[order] = lu.solve(b)
+    else:
+        solve = splinalg.cg if symmetric else splinalg.bicgstab
+        with profiler.phase('solve.iterations'):
+            times, info = solve(A, b, rtol=tol, maxiter=10*len(points))
+        if info!=0:
+            raise RuntimeError(f'The iterative solver did not converge (info={info})')
+
+    return coords, times
+
+
+class TimeField():
+    """
+    A class used to represent the expected time to reach the food from every 
+    inside point as a 2-D array aligned with the lattice of the inside points
+    ...
+
+    Attributes
+    ----------
+    field : np.array
+        expected time of each point of the lattice, nan on the points that
+        are not inside points
+    origin : np.array
+        coordinates of the point stored in field[0, 0]
+
+
+    Methods
+    -------
+    __getitem__(point)
+        Returns the expected time starting from point
+    lookup(x, y)
+        Returns the expected times starting from arrays of coordinates
+    """
+
+
+    def __init__(self, field, origin) -> None:
+        self.field = field
+        self.origin = np.asarray(origin, dtype=float)
+
+
+    def __getitem__(self, point:tuple):
+        assert len(point)==2
+        return self.lookup(np.asarray(point[0]), np.asarray(point[1]))[()]
+
+
+    def lookup(self, x, y):
+        """
+        Returns the expected times starting from arrays of coordinates,
+        nan for the points that are not inside points
+        """
+        x = np.asarray(x, dtype=float) - self.origin[0]
+        y = np.asarray(y, dtype=float) - self.origin[1]
+        i = np.rint(x)
+        j = np.rint(y)
+        valid = (i==x) & (j==y) & (i>=0) & (i<self.field.shape[0]) & (j>=0) & (j<self.field.shape[1])
+        times = np.full(np.broadcast(x, y).shape, np.nan)
+        times[valid] = self.field[i[valid].astype(np.int64), j[valid].astype(np.int64)]
+        return times
+
+
+def expected_time_field(constraints, method:str='direct', times=None):
+    """
+    Returns the TimeField with the expected time to reach the food from every 
+    inside point, aligned with the lookup table of the constraints.
+    The expected times of all the inside points can be given if already known.
+    """
+    if times is None:
+        coords, values = solve_expected_times(constraints, method=method)
+    else:
+        coords = np.array(times.index.tolist(), dtype=float).reshape(-1, 2)
+        values = times.to_numpy()
+    return time_field(constraints, coords, values)
+
+
+def time_field(constraints, coords, times):
+    """
+    Returns the TimeField of the expected times of the inside points with
+    coordinates coords, aligned with the lookup table of the constraints
+    """
+    if constraints.lookup is None:
+        constraints.build_lookup()
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    i = np.rint(coords[:, 0] - constraints.lookup_origin[0]).astype(np.int64)
+    j = np.rint(coords[:, 1] - constraints.lookup_origin[1]).astype(np.int64)
+    field = np.full(constraints.lookup.shape, np.nan)
+    field[i, j] = times
+    return TimeField(field, constraints.lookup_origin)
+
+
+def calculate_exact_solution(constraints, starting_point:tuple=(0.,0.), method:str='direct', times=None):
+    """
+    Calculates the exact average time to reach the food starting from starting_point.
+    The expected times of all the inside points can be given if already known,
+    as a Series or as a TimeField.
+    """
+    assert len(starting_point)==2
+    if times is None:
+        times = expected_times(constraints, method=method)
+    # calculate solution for a specific starting point
+    solution = times[starting_point]
+    return solution
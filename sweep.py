@@ -0,0 +1,149 @@
+import os
+import hashlib
+import itertools
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import boundary_func
+import kernels
+from ants import Ants
+from constraints import Constraint
+from solver import calculate_exact_solution
+from utils import read_yaml
+
+
+CONFIG_PATH = 'config.yaml'
+RESULT_COLUMNS = [
+    'domain', 'num_inside', 'exact', 'mu', 'sigma', 'lower_bound',
+    'upper_bound', 'alive_perc', 'steps', 'error'
+    ]
+
+
+def parameter_grid(parameters:dict):
+    """
+    Returns every combination of the values of the parameters
+    """
+    names = list(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*parameters.values())]
+
+
+def discover_domain(family:str, params:dict, initial_position:tuple, max_points:int, kernel=None):
+    """
+    Finds the inside points of the boundary of the family with the given
+    parameters. Returns the constraints and the hash of the inside points, or
+    the error message if the domain could not be explored.
+    """
+    constraints = Constraint(getattr(boundary_func, family)(**params), mode='lookup', kernel=kernel)
+    try:
+        constraints.evaluate_points(start_points={initial_position}, max_iter=max_points)
+    except RuntimeError as e:
+        return None, None, str(e)
+    inside = np.array(sorted(constraints.inside_points))
+    domain = hashlib.sha256(inside.tobytes()).hexdigest()[:16]
+    return constraints, domain, None
+
+
+def solve_domain(constraints, initial_position:tuple, exact:bool, num_ants:int, max_steps:int, seed:int):
+    """
+    Calculates the exact solution and/or simulates num_ants ants on the domain
+    """
+    result = {'num_inside': len(constraints.inside_points)}
+    if exact:
+        result['exact'] = calculate_exact_solution(constraints, initial_position)
+    if num_ants>0:
+        constraints.find_closest_boundary()
+        ants = Ants(num_ants, initial_position, rng=np.random.default_rng(seed), max_steps=max_steps)
+        while ants.step<max_steps and ants.any_alive():
+            ants.move(constraints)
+        for name in ['mu', 'sigma', 'lower_bound', 'upper_bound', 'alive_perc']:
+            result[name] = getattr(ants, name)[ants.step]
+        result['steps'] = ants.step
+    return result
+
+
+def write_rows(rows:list, path:str):
+    """
+    Appends the rows to the csv file at path, writing the header only once
+    """
+    if path is None or len(rows)==0:
+        return
+    rows = pd.DataFrame(rows)
+    rows.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+
+def run_sweep(family:str, parameters:dict, initial_position:tuple=(0.,0.), max_points:int=1000,
+    exact:bool=True, num_ants:int=0, max_steps:int=1000, seed:int=0, num_workers:int=None, path:str=None, kernel=None):
+    """
+    Solves every combination of the parameters of a family of boundaries
+    across a pool of processes. The combinations with the same inside points
+    are solved only once. The ants move with the kernel (simple walk by
+    default). The file at path is replaced, each row of results is appended
+    to it as soon as it is available and the whole table is returned.
+    """
+    if path is not None:
+        # the rows of a previous sweep may have other columns
+        if os.path.exists(path):
+            os.remove(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    grid = parameter_grid(parameters)
+    names = list(parameters)
+    columns = ['family'] + names + RESULT_COLUMNS
+
+    def row(i:int, result:dict):
+        params = {name: str(value) if isinstance(value, (list, tuple)) else value for name, value in grid[i].items()}
+        return {'index': i, 'family': family, **params, **result}
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        # explore the domains and group the parameters with the same domain
+        domains = {}
+        failed = []
+        explored = pool.map(discover_domain, repeat(family), grid, repeat(initial_position), repeat(max_points), repeat(kernel))
+        for i, (constraints, domain, error) in enumerate(explored):
+            if error is not None:
+                failed.append(row(i, {'error': error}))
+            else:
+                domains.setdefault(domain, (constraints, []))[1].append(i)
+        write_rows([{k: r.get(k) for k in columns} for r in failed], path)
+        rows += failed
+        # solve each domain once
+        futures = {
+            pool.submit(solve_domain, constraints, initial_position, exact, num_ants, max_steps, seed): domain
+            for domain, (constraints, _) in domains.items()
+            }
+        for future in as_completed(futures):
+            domain = futures[future]
+            result = {'domain': domain, **future.result()}
+            solved = [row(i, result) for i in domains[domain][1]]
+            write_rows([{k: r.get(k) for k in columns} for r in solved], path)
+            rows += solved
+
+    table = pd.DataFrame(rows).sort_values('index').set_index('index')
+    return table.reindex(columns=columns)
+
+
+def main():
+
+    cfg = read_yaml(CONFIG_PATH)
+    table = run_sweep(
+        family = cfg['sweep']['FAMILY'],
+        parameters = cfg['sweep']['PARAMETERS'],
+        initial_position = cfg['ants']['INITIAL_POSITION'],
+        max_points = cfg['solution']['MAX_POINTS'],
+        exact = cfg['sweep']['EXACT'],
+        num_ants = cfg['sweep']['NUM_ANTS'],
+        max_steps = cfg['tracking']['MAX_STEPS'],
+        seed = cfg['ants']['SEED'],
+        num_workers = cfg['sweep']['NUM_WORKERS'],
+        path = cfg['sweep']['PATH'],
+        kernel = getattr(kernels, cfg['ants']['KERNEL'])(**(cfg['ants']['KERNEL_PARAMETERS'] or {}))
+        )
+    print(table.to_string())
+
+    return table
+
+
+if __name__=="__main__":
+
+    main()
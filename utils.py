@@ -14,7 +14,7 @@ def points_distance(p1:tuple, p2:tuple):
     Returns the distance in steps from point p1 to point p2
     """
     assert len(p1)==len(p2)
-    return np.abs((np.array(p1)-np.array(p2)).sum())
+    return np.abs(np.array(p1)-np.array(p2)).sum()
 
 
 def dict2keys_values(d:dict):
@@ -33,4 +33,33 @@ def dict2keys_values(d:dict):
 
 def read_yaml(file_path):
     with open(file_path, "r") as f:
-        return yaml.load(f, yaml.Loader)
\ No newline at end of file
+        return yaml.load(f, yaml.Loader)
+
+def apply_overrides(cfg:dict, overrides:list=None):
+    """
+    Changes the parameters of the configuration given as 'SECTION.KEY=VALUE'
+    strings, the values are read as YAML
+    """
+    for override in overrides or []:
+        name, equal, value = override.partition('=')
+        section, dot, key = name.partition('.')
+        if not equal or not dot:
+            raise ValueError(f"Error: the override '{override}' must have the form SECTION.KEY=VALUE")
+        if section not in cfg or key not in cfg[section]:
+            raise ValueError(f"Error: unknown parameter '{name}'")
+        cfg[section][key] = yaml.load(value, yaml.Loader)
+    return cfg
+
+def lattice_index(points, border:int=1):
+    """
+    Returns a table mapping the lattice coordinates of the points to their
+    position in points, the integer lattice coordinates of the points and the
+    origin of the lattice. The table has a border of empty cells, so the
+    points reached by moves of up to border steps are always inside the table.
+    """
+    coords = np.asarray(points, dtype=float).reshape(-1, 2)
+    origin = coords.min(axis=0) - border
+    ij = np.rint(coords - origin).astype(np.int64)
+    table = np.full(ij.max(axis=0) + border + 1, -1, dtype=np.int64)
+    table[ij[:, 0], ij[:, 1]] = np.arange(len(ij))
+    return table, ij, origin
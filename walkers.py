@@ -0,0 +1,239 @@
+import time
+import numpy as np
+from profiler import profiler
+
+# the kernel of the walkers is compiled if numba is installed
+try:
+    import numba
+    prange = numba.prange
+except ImportError:
+    numba = None
+    prange = range
+
+
+BACKENDS = ('auto', 'numba', 'numpy', 'python')
+# outcomes of a walk and columns of the totals of the chunks
+HIT, ESCAPED, TRUNCATED, STEPS, HIT_TIMES = 0, 1, 2, 3, 4
+
+
+def hitting_bins(max_steps:int, num_bins:int=64):
+    """
+    Returns the edges of geometric bins of the hitting times from 1 to
+    max_steps, the bin b holds the times edges[b] <= t < edges[b+1]
+    """
+    edges = np.unique(np.geomspace(1, max_steps + 1, num_bins + 1).astype(np.int64))
+    edges[0] = 1
+    edges[-1] = max_steps + 1
+    return edges
+
+
+def window_table(constraints, origin, radius:int, rows:int=1024):
+    """
+    Returns the table of the lattice points origin + (i - radius, j - radius)
+    that respect the boundaries. The points are evaluated in blocks of rows,
+    so the boundary functions of unbounded domains can be used.
+    """
+    offsets = np.arange(-radius, radius + 1, dtype=float)
+    table = np.zeros((len(offsets), len(offsets)), dtype=bool)
+    for first in range(0, len(offsets), rows):
+        x, y = np.meshgrid(origin[0] + offsets[first:first+rows], origin[1] + offsets, indexing='ij')
+        table[first:first+rows] = constraints.evaluate(x.ravel(), y.ravel()).reshape(x.shape)
+    return table
+
+
+def walk_chunks(inside, start, offsets, cumulative, digits:int, max_steps:int, edges, counts, seeds):
+    """
+    Moves counts[c] walkers of each chunk c one at a time from start until
+    they leave the inside points of the table (hit), the table (escaped) or
+    reach max_steps (truncated). Returns the histogram of the hitting times
+    of each chunk, the totals of each chunk (hits, escapes, truncated, steps,
+    sum of the hitting times) and the sum of the squared hitting times.
+    Each chunk seeds its own random stream, so the results do not depend on
+    the threads running the chunks. With a uniform kernel each random number
+    gives digits moves. The function is compiled by numba if available and
+    runs as plain Python otherwise.
+    """
+    num_chunks = len(counts)
+    num_moves = len(offsets)
+    height, width = inside.shape
+    histogram = np.zeros((num_chunks, len(edges) - 1), dtype=np.int64)
+    totals = np.zeros((num_chunks, 5), dtype=np.int64)
+    squares = np.zeros(num_chunks)
+    for c in prange(num_chunks):
+        np.random.seed(seeds[c])
+        bits = 0
+        left = 0
+        for _ in range(counts[c]):
+            i = start[0]
+            j = start[1]
+            step = 0
+            outcome = TRUNCATED
+            while step<max_steps:
+                if digits>0:
+                    if left==0:
+                        bits = np.int64(np.random.random()*num_moves**digits)
+                        left = digits
+                    k = bits%num_moves
+                    bits //= num_moves
+                    left -= 1
+                else:
+                    u = np.random.random()
+                    k = 0
+                    while k<num_moves-1 and u>=cumulative[k]:
+                        k += 1
+                i += offsets[k, 0]
+                j += offsets[k, 1]
+                step += 1
+                if i<0 or i>=height or j<0 or j>=width:
+                    outcome = ESCAPED
+                    break
+                if not inside[i, j]:
+                    outcome = HIT
+                    break
+            totals[c, outcome] += 1
+            totals[c, STEPS] += step
+            if outcome==HIT:
+                histogram[c, np.searchsorted(edges, step, side='right') - 1] += 1
+                totals[c, HIT_TIMES] += step
+                squares[c] += float(step)*step
+    return histogram, totals, squares
+
+
+compiled_walk_chunks = None
+
+
+def compiled_walk():
+    """
+    Returns walk_chunks compiled by numba (once per process)
+    """
+    global compiled_walk_chunks
+    if numba is None:
+        raise ValueError("Error: the 'numba' backend needs numba to be installed")
+    if compiled_walk_chunks is None:
+        compiled_walk_chunks = numba.njit(parallel=True, cache=True)(walk_chunks)
+    return compiled_walk_chunks
+
+
+def walk_numpy(inside, start, kernel, max_steps:int, edges, counts, seeds, block_size:int=2**16):
+    """
+    Same results as walk_chunks (with other random numbers), moving the
+    walkers of a chunk together with NumPy. The alive walkers draw blocks of
+    moves, as many as they need to fill block_size positions, so the few
+    walkers of the tail also move fast. The memory is bounded by the size of
+    the chunks and by block_size.
+    """
+    height, width = inside.shape
+    histogram = np.zeros((len(counts), len(edges) - 1), dtype=np.int64)
+    totals = np.zeros((len(counts), 5), dtype=np.int64)
+    squares = np.zeros(len(counts))
+    for c, (count, seed) in enumerate(zip(counts, seeds)):
+        rng = np.random.default_rng(seed)
+        positions = np.tile(np.asarray(start, dtype=np.int64), (count, 1))
+        step = 0
+        while len(positions)>0 and step<max_steps:
+            n = len(positions)
+            block = int(min(max(block_size//n, 1), max_steps - step))
+            moves = kernel.offsets[kernel.sample(rng, n*block)].reshape(n, block, 2)
+            paths = positions[:, None, :] + np.cumsum(moves, axis=1)
+            i = paths[..., 0]
+            j = paths[..., 1]
+            escaped = (i<0) | (i>=height) | (j<0) | (j>=width)
+            stopped = escaped.copy()
+            stopped[~escaped] = ~inside[i[~escaped], j[~escaped]]
+            # first position of each walker out of the inside points
+            done = stopped.any(axis=1)
+            first = stopped.argmax(axis=1)
+            is_escaped = done & escaped[np.arange(n), first]
+            is_hit = done & ~is_escaped
+            times = step + first + 1
+            hit_times = times[is_hit]
+            histogram[c] += np.bincount(
+                np.searchsorted(edges, hit_times, side='right') - 1, 
+                minlength = len(edges) - 1
+                )
+            totals[c, HIT] += len(hit_times)
+            totals[c, ESCAPED] += int(is_escaped.sum())
+            totals[c, STEPS] += int(times[done].sum())
+            totals[c, HIT_TIMES] += int(hit_times.sum())
+            squares[c] += (hit_times.astype(float)**2).sum()
+            positions = paths[~done, -1]
+            step += block
+        totals[c, TRUNCATED] += len(positions)
+        totals[c, STEPS] += max_steps*len(positions)
+    return histogram, totals, squares
+
+
+def run_walkers(constraints, initial_position:tuple, num_walkers:int, max_steps:int, radius:int=None,
+    num_bins:int=64, chunk_size:int=10000, backend:str='auto', num_threads:int=None, seed:int=None):
+    """
+    Simulates num_walkers independent ants from initial_position up to
+    max_steps steps each and returns the histogram of their hitting times
+    (bin edges and counts) and a report with the fractions of escaped and
+    truncated walkers. The ants move on a table of radius points around the
+    initial position (max_steps times the longest move if not given, at
+    most 1024), the ants leaving the table are escaped. The walkers are split
+    in chunks of chunk_size, moved in parallel by the 'numba' backend, by
+    blocks of steps of a whole chunk by 'numpy' and one walker at a time by
+    'python'; 'auto' is 'numba' if installed and 'numpy' otherwise.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Error: 'backend' must be one of {BACKENDS}")
+    if backend=='auto':
+        backend = 'numpy' if numba is None else 'numba'
+    kernel = constraints.kernel
+    longest = int(np.abs(kernel.offsets).max())
+    if radius is None:
+        radius = min(max_steps*longest, 1024)
+    with profiler.phase('walkers.window'):
+        inside = window_table(constraints, initial_position, radius)
+    if not inside[radius, radius]:
+        raise ValueError("Error: the initial position is not inside the boundaries")
+    start = np.array([radius, radius], dtype=np.int64)
+    edges = hitting_bins(max_steps, num_bins)
+    counts = np.full(num_walkers//chunk_size, chunk_size, dtype=np.int64)
+    if num_walkers%chunk_size:
+        counts = np.append(counts, num_walkers%chunk_size)
+    seeds = np.random.SeedSequence(seed).generate_state(len(counts))
+
+    begin = time.perf_counter()
+    with profiler.phase('walkers.walk'):
+        if backend=='numpy':
+            histogram, totals, squares = walk_numpy(inside, start, kernel, max_steps, edges, counts, seeds)
+        else:
+            offsets = kernel.offsets.astype(np.int64)
+            cumulative = np.cumsum(kernel.probabilities)
+            cumulative[-1] = 1.
+            # moves drawn from the digits of a random number with 52 random bits
+            digits = int(52//np.log2(len(offsets))) if kernel.uniform and len(offsets)>1 else 0
+            args = (inside, start, offsets, cumulative, digits, max_steps, edges, counts, seeds)
+            if backend=='numba':
+                if num_threads:
+                    numba.set_num_threads(num_threads)
+                histogram, totals, squares = compiled_walk()(*args)
+            else:
+                # the python backend uses the global random state, as numba does
+                state = np.random.get_state()
+                histogram, totals, squares = walk_chunks(*args)
+                np.random.set_state(state)
+    seconds = time.perf_counter() - begin
+    histogram = histogram.sum(axis=0)
+    totals = totals.sum(axis=0)
+    profiler.count('walker_steps', int(totals[STEPS]), phase='walkers.walk')
+
+    hits = int(totals[HIT])
+    mean = totals[HIT_TIMES]/hits if hits>0 else np.nan
+    report = {
+        'backend': backend,
+        'walkers': num_walkers,
+        'hit': hits,
+        'escaped': int(totals[ESCAPED]),
+        'truncated': int(totals[TRUNCATED]),
+        'escaped_fraction': totals[ESCAPED]/num_walkers,
+        'truncated_fraction': totals[TRUNCATED]/num_walkers,
+        'mean_hit_time': mean,
+        'std_hit_time': np.sqrt(max(squares.sum()/hits - mean**2, 0.)) if hits>0 else np.nan,
+        'steps': int(totals[STEPS]),
+        'seconds': seconds,
+        'steps_per_second': totals[STEPS]/seconds if seconds>0 else np.nan,
+        }
+    return (edges, histogram), report
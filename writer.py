@@ -0,0 +1,199 @@
+import os
+import shutil
+import pandas as pd
+
+
+FORMATS = ('.csv', '.parquet', '.arrow')
+
+
+def history_format(path:str):
+    """
+    Returns the format of the history file from its extension
+    """
+    ext = os.path.splitext(path)[1]
+    if ext not in FORMATS:
+        raise ValueError(f"Error: the history path must end with one of {FORMATS}")
+    return ext
+
+
+def read_history(path:str):
+    """
+    Returns the history written by a HistoryWriter up to the last flushed
+    step, also while it is still being written
+    """
+    ext = history_format(path)
+    if not os.path.exists(path):
+        return None
+    if ext=='.csv':
+        return pd.read_csv(path, index_col=0, float_precision='round_trip')
+    if ext=='.parquet':
+        parts = sorted(os.listdir(path))
+        if len(parts)==0:
+            return None
+        return pd.concat([pd.read_parquet(os.path.join(path, part)) for part in parts])
+    # the last batch of a stream still being written may be incomplete
+    import pyarrow as pa
+    batches = []
+    with open(path, 'rb') as source:
+        try:
+            for batch in pa.ipc.open_stream(source):
+                batches.append(batch)
+        except (pa.ArrowInvalid, OSError):
+            pass
+    if len(batches)==0:
+        return None
+    return pa.Table.from_batches(batches).to_pandas()
+
+
+class HistoryWriter():
+    """
+    A class used to represent a sink that streams the history of the ants to
+    a file while the simulation runs.
+    The writer only records the last step received: the rows are already in
+    the history of the ants, so they are read from there and appended in
+    chunks of chunk_size steps, one dataframe per chunk. The file always holds
+    the history up to the last flushed step, which can be read at any time
+    with read_history.
+    The format follows the extension of the path: '.csv' appends the rows to
+    a text file, '.parquet' writes each chunk to a new file of a directory
+    and '.arrow' appends each chunk as a record batch of an Arrow IPC stream.
+    ...
+
+    Attributes
+    ----------
+    path : str
+        path of the history file (directory for '.parquet')
+    format : str
+        extension of the path
+    chunk_size : int
+        number of steps written at each flush
+    written : int
+        number of steps already flushed to the file
+    received : int
+        number of steps received, flushed or not
+    ants : ants.Ants
+        ants of the last write, holding the history of the steps not flushed yet
+    stream : pyarrow.ipc.RecordBatchStreamWriter
+        open stream of the '.arrow' format
+
+
+    Methods
+    -------
+    write(ants)
+        Records the steps of the ants received and flushes the full chunks
+    flush()
+        Appends the received steps not written yet to the file
+    rewind(step:int)
+        Drops the steps after step from the file
+    close()
+        Flushes the received steps and closes the file
+    """
+
+
+    def __init__(self, path:str, chunk_size:int=1000, resume:bool=False) -> None:
+        self.path = path
+        self.format = history_format(path)
+        self.chunk_size = chunk_size
+        self.written = 0
+        self.received = 0
+        self.ants = None
+        self.stream = None
+        self._sink = None
+        if resume:
+            # continue after the last flushed step
+            self.rewind(None)
+        else:
+            self.remove()
+
+
+    def remove(self):
+        """
+        Deletes the output of the writer
+        """
+        self.close_stream()
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+
+    def write(self, ants):
+        """
+        Records the steps of the ants received and flushes the full chunks
+        """
+        self.ants = ants
+        self.received = max(self.received, ants.step+1)
+        if self.received - self.written>=self.chunk_size:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Appends the received steps not written yet to the file
+        """
+        if self.ants is None or self.received<=self.written:
+            return self.written
+        return self.append(self.ants.get_history(start=self.written, stop=self.received))
+
+
+    def append(self, rows):
+        """
+        Appends the rows of the history to the file
+        """
+        if self.format=='.csv':
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            rows.to_csv(self.path, mode='a', header=self.written==0)
+        elif self.format=='.parquet':
+            os.makedirs(self.path, exist_ok=True)
+            rows.to_parquet(os.path.join(self.path, f'part-{self.written:09d}.parquet'))
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(rows)
+            if self.stream is None:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._sink = open(self.path, 'wb')
+                self.stream = pa.ipc.new_stream(self._sink, table.schema)
+            self.stream.write_table(table)
+            self._sink.flush()
+        self.written += len(rows)
+        self.received = max(self.received, self.written)
+
+        return self.written
+
+
+    def rewind(self, step:int=None):
+        """
+        Drops the steps after step from the file (the unflushed steps are
+        always dropped) and continues writing from there
+        """
+        self.close_stream()
+        history = read_history(self.path)
+        self.written = 0
+        self.received = 0
+        self.ants = None
+        self.remove()
+        if history is not None:
+            if step is not None:
+                history = history.loc[:step]
+            if len(history)>0:
+                self.append(history)
+
+        return self.written
+
+
+    def close_stream(self):
+        if self.stream is not None:
+            self.stream.close()
+            self._sink.close()
+            self.stream = None
+            self._sink = None
+
+
+    def close(self):
+        """
+        Flushes the received steps and closes the file
+        """
+        self.flush()
+        self.close_stream()
+
+        return self.written